@@ -0,0 +1,384 @@
+"""Record and replay API traffic for offline, deterministic runs.
+
+RecordingClient wraps the real client and writes every messages.create /
+messages.stream call, with its response and streaming chunk timing, to a
+cassette directory. ReplayClient serves those cassettes back without any
+network, paced and broken according to a LatencyProfile.
+
+    python main.py --record cassettes/
+    python main.py --replay cassettes/ --profile slow-first-token
+    python api_harness.py bench cassettes/ --profile rate-limit-burst --concurrency 4
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+BASE64_PLACEHOLDER_MIN = 1024  # Longer "data" strings are stored as a digest only
+
+
+def _strip_payloads(value):
+    """Copy of request params with large base64 data replaced by its digest"""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key == "data" and isinstance(item, str) and len(item) >= BASE64_PLACEHOLDER_MIN:
+                result[key] = "sha256:" + hashlib.sha256(item.encode('ascii')).hexdigest()
+            else:
+                result[key] = _strip_payloads(item)
+        return result
+    if isinstance(value, (list, tuple)):
+        return [_strip_payloads(item) for item in value]
+    return value
+
+
+def request_key(params):
+    """Stable key for matching a request to its recording"""
+    canonical = json.dumps(_strip_payloads(params), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _to_dict(obj):
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump(mode='json')
+    return obj
+
+
+def _to_namespace(value):
+    """Turn recorded JSON back into an object with attribute access"""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _to_namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(item) for item in value]
+    return value
+
+
+# -- Recording ---------------------------------------------------------------
+
+class RecordingClient:
+    """Wraps a real client and writes each messages call to cassette_dir"""
+
+    def __init__(self, client, cassette_dir):
+        self._client = client
+        self.cassette_dir = cassette_dir
+        os.makedirs(cassette_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._count = len(glob.glob(os.path.join(cassette_dir, '*.json')))
+        self.messages = _RecordingMessages(client.messages, self)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def save(self, interaction):
+        with self._lock:
+            self._count += 1
+            path = os.path.join(self.cassette_dir, f"{self._count:05d}-{interaction['kind']}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(interaction, f, indent=1)
+
+
+class _RecordingMessages:
+    def __init__(self, messages, recorder):
+        self._messages = messages
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._messages, name)
+
+    def create(self, **params):
+        interaction = {"kind": "create", "key": request_key(params), "request": _strip_payloads(params)}
+        start = time.perf_counter()
+        try:
+            response = self._messages.create(**params)
+        except Exception as e:
+            interaction.update(error=_describe_error(e), duration=time.perf_counter() - start)
+            self._recorder.save(interaction)
+            raise
+        interaction.update(response=_to_dict(response), duration=time.perf_counter() - start)
+        self._recorder.save(interaction)
+        return response
+
+    def stream(self, **params):
+        return _RecordingStreamManager(self._messages.stream(**params), self._recorder, params)
+
+
+class _RecordingStreamManager:
+    def __init__(self, manager, recorder, params):
+        self._manager = manager
+        self._recorder = recorder
+        self.interaction = {"kind": "stream", "key": request_key(params), "request": _strip_payloads(params), "chunks": []}
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return _RecordingStream(self._manager.__enter__(), self)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.interaction["duration"] = time.perf_counter() - self._start
+        if exc is not None:
+            self.interaction["error"] = _describe_error(exc)
+        self._recorder.save(self.interaction)
+        return self._manager.__exit__(exc_type, exc, tb)
+
+
+class _RecordingStream:
+    def __init__(self, stream, manager):
+        self._stream = stream
+        self._manager = manager
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    @property
+    def text_stream(self):
+        chunks = self._manager.interaction["chunks"]
+        start = self._manager._start
+        for text in self._stream.text_stream:
+            chunks.append([round(time.perf_counter() - start, 4), text])
+            yield text
+
+    def get_final_message(self):
+        message = self._stream.get_final_message()
+        self._manager.interaction["response"] = _to_dict(message)
+        return message
+
+
+def _describe_error(error):
+    return {"type": type(error).__name__, "status": getattr(error, 'status_code', None), "message": str(error)}
+
+
+# -- Replay ------------------------------------------------------------------
+
+class LatencyProfile:
+    """How replayed responses are paced and which failures are injected.
+
+    first_token_delay / chunk_delay override the recorded timing when set,
+    speed scales the recorded timing (2.0 = twice as fast), chars_per_second
+    caps throughput. rate_limit_burst fails the first N calls with 429,
+    disconnect_after_chunks cuts every stream after N chunks and
+    error_rate fails that share of calls at random (seeded).
+    """
+
+    def __init__(self, name, first_token_delay=None, chunk_delay=None, speed=1.0,
+                 chars_per_second=None, rate_limit_burst=0, disconnect_after_chunks=None,
+                 error_rate=0.0, seed=0):
+        self.name = name
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.speed = speed
+        self.chars_per_second = chars_per_second
+        self.rate_limit_burst = rate_limit_burst
+        self.disconnect_after_chunks = disconnect_after_chunks
+        self.error_rate = error_rate
+        self.seed = seed
+
+
+PROFILES = {
+    "instant": LatencyProfile("instant", first_token_delay=0, chunk_delay=0),
+    "recorded": LatencyProfile("recorded"),
+    "slow-first-token": LatencyProfile("slow-first-token", first_token_delay=8.0),
+    "slow-stream": LatencyProfile("slow-stream", chars_per_second=40),
+    "rate-limit-burst": LatencyProfile("rate-limit-burst", rate_limit_burst=3),
+    "disconnect": LatencyProfile("disconnect", disconnect_after_chunks=5),
+    "flaky": LatencyProfile("flaky", error_rate=0.25, seed=1),
+}
+
+
+def make_api_error(status, message="Injected by replay profile"):
+    """Build the SDK exception the real client would raise (status None = disconnect)"""
+    import anthropic # type: ignore
+    import httpx # type: ignore
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    if status is None:
+        return anthropic.APIConnectionError(message=message, request=request)
+    error_type = "rate_limit_error" if status == 429 else "overloaded_error" if status == 529 else "api_error"
+    body = {"type": "error", "error": {"type": error_type, "message": message}}
+    response = httpx.Response(status, request=request, json=body)
+    if status == 429:
+        return anthropic.RateLimitError(message, response=response, body=body)
+    if status >= 500:
+        return anthropic.InternalServerError(message, response=response, body=body)
+    return anthropic.APIStatusError(message, response=response, body=body)
+
+
+class ReplayClient:
+    """Stand-in for the API client that serves recorded cassettes.
+
+    Requests are matched by their key; unmatched ones get the next
+    recording of the same kind in order, unless strict is set.
+    """
+
+    def __init__(self, cassette_dir, profile=PROFILES["recorded"], strict=False, sleep=time.sleep):
+        self.profile = profile
+        self.strict = strict
+        self.sleep = sleep
+        self.by_key = {}
+        self.by_kind = {"create": [], "stream": []}
+        for path in sorted(glob.glob(os.path.join(cassette_dir, '*.json'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                interaction = json.load(f)
+            if "response" not in interaction:
+                continue  # Failed recordings have nothing to serve
+            self.by_key.setdefault(interaction["key"], []).append(interaction)
+            self.by_kind.setdefault(interaction["kind"], []).append(interaction)
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._next = {}  # {kind or key: index of the next recording to serve}
+        self._random = random.Random(profile.seed)
+        self.messages = _ReplayMessages(self)
+        self.models = SimpleNamespace(list=lambda **kwargs: SimpleNamespace(data=[]))
+
+    def _find(self, kind, params):
+        key = request_key(params)
+        with self._lock:
+            self._calls += 1
+            call = self._calls
+            fail = self._random.random() < self.profile.error_rate
+            pool, slot = self.by_key.get(key), key
+            if not pool:
+                if self.strict:
+                    raise LookupError(f"No recording for request {key[:12]}")
+                pool, slot = self.by_kind.get(kind), kind
+            if not pool:
+                raise LookupError(f"No {kind} recordings to replay")
+            index = self._next.get(slot, 0)
+            self._next[slot] = index + 1
+        if call <= self.profile.rate_limit_burst:
+            raise make_api_error(429)
+        if fail:
+            raise make_api_error(self._random.choice((429, 529, None)))
+        return pool[index % len(pool)]
+
+    def chunk_delays(self, interaction):
+        """Seconds to wait before each chunk of a recording"""
+        profile = self.profile
+        chunks = interaction.get("chunks") or [[interaction.get("duration", 0), _response_text(interaction)]]
+        delays = []
+        previous = 0.0
+        for i, (offset, text) in enumerate(chunks):
+            if i == 0 and profile.first_token_delay is not None:
+                delay = profile.first_token_delay
+            elif i > 0 and profile.chunk_delay is not None:
+                delay = profile.chunk_delay
+            else:
+                delay = max(0.0, offset - previous) / profile.speed
+            if profile.chars_per_second:
+                delay = max(delay, len(text) / profile.chars_per_second)
+            delays.append(delay)
+            previous = offset
+        return chunks, delays
+
+
+def _response_text(interaction):
+    content = interaction.get("response", {}).get("content", [])
+    return "".join(block.get("text", "") for block in content)
+
+
+class _ReplayMessages:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, **params):
+        interaction = self._client._find("create", params)
+        chunks, delays = self._client.chunk_delays(interaction)
+        self._client.sleep(sum(delays))
+        return _to_namespace(interaction["response"])
+
+    def stream(self, **params):
+        return _ReplayStream(self._client, params)
+
+
+class _ReplayStream:
+    def __init__(self, client, params):
+        self._client = client
+        self._params = params
+
+    def __enter__(self):
+        self._interaction = self._client._find("stream", self._params)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    @property
+    def text_stream(self):
+        chunks, delays = self._client.chunk_delays(self._interaction)
+        limit = self._client.profile.disconnect_after_chunks
+        for i, ((offset, text), delay) in enumerate(zip(chunks, delays)):
+            if limit is not None and i >= limit:
+                raise make_api_error(None, "Connection lost mid-stream (replay profile)")
+            self._client.sleep(delay)
+            yield text
+
+    def get_final_message(self):
+        return _to_namespace(self._interaction["response"])
+
+
+# -- Benchmark ---------------------------------------------------------------
+
+def bench(cassette_dir, profile, concurrency=1, repeat=1):
+    """Replay every recording and report time to first chunk and total time"""
+    from concurrent.futures import ThreadPoolExecutor
+    client = ReplayClient(cassette_dir, profile)
+    requests = [item for kind in ("stream", "create") for item in client.by_kind.get(kind, [])] * repeat
+
+    def run(interaction):
+        start = time.perf_counter()
+        first = None
+        try:
+            if interaction["kind"] == "stream":
+                with client.messages.stream(**interaction["request"]) as stream:
+                    for _ in stream.text_stream:
+                        if first is None:
+                            first = time.perf_counter() - start
+                    stream.get_final_message()
+            else:
+                client.messages.create(**interaction["request"])
+            error = None
+        except Exception as e:
+            error = type(e).__name__
+        total = time.perf_counter() - start
+        return first if first is not None else total, total, error
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(run, requests))
+    wall = time.perf_counter() - wall_start
+
+    ok = [result for result in results if result[2] is None]
+    errors = {}
+    for result in results:
+        if result[2]:
+            errors[result[2]] = errors.get(result[2], 0) + 1
+    print(f"profile={profile.name} requests={len(results)} concurrency={concurrency} wall={wall:.2f}s")
+    if ok:
+        for label, values in (("first chunk", sorted(r[0] for r in ok)), ("total", sorted(r[1] for r in ok))):
+            p50 = values[len(values) // 2]
+            p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+            print(f"  {label:>11}: p50={p50:.3f}s p95={p95:.3f}s max={values[-1]:.3f}s")
+    for name, count in sorted(errors.items()):
+        print(f"  {name}: {count}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded API cassettes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench", help="replay all cassettes and report latency")
+    bench_parser.add_argument("cassette_dir")
+    bench_parser.add_argument("--profile", choices=sorted(PROFILES), default="recorded")
+    bench_parser.add_argument("--concurrency", type=int, default=1)
+    bench_parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+    if args.command == "bench":
+        bench(args.cassette_dir, PROFILES[args.profile], args.concurrency, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
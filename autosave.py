@@ -0,0 +1,296 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+AUTOSAVE_DIR = 'autosave'
+BLOB_DIR = os.path.join(AUTOSAVE_DIR, 'blobs')
+LOCK_NAME = 'lock'
+DEBOUNCE_MS = 1500  # Quiet time after the last change before saving
+MAX_DELAY_MS = 10000  # Save at least this often while changes keep coming
+BLOB_GRACE = 60  # Seconds a new blob is kept before a session file refers to it
+
+_run = None  # (directory, locked file) of this process, see run_dir
+_orphans = {}  # {directory: locked file} of finished runs claimed by find_autosaves
+
+
+def write_atomic(path, write):
+    """Call write(f) on a temp file next to path, then rename it over path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_json_atomic(path, data):
+    write_atomic(path, lambda f: json.dump(data, f))
+
+
+def _try_lock(f):
+    """Lock f exclusively without waiting; False if another process holds it"""
+    try:
+        if os.name == 'nt':
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def run_dir():
+    """This process's autosave directory, created and locked on first use.
+
+    The lock is held until the process exits; that is how another instance
+    tells sessions still in use from ones left by a closed or crashed run.
+    """
+    global _run
+    if _run is None:
+        directory = os.path.join(AUTOSAVE_DIR, f"run-{os.getpid()}-{time.time_ns()}")
+        os.makedirs(directory)
+        f = open(os.path.join(directory, LOCK_NAME), 'w')
+        _try_lock(f)
+        _run = (directory, f)
+    return _run[0]
+
+
+def new_autosave_path():
+    return os.path.join(run_dir(), f"session-{time.time_ns()}.json")
+
+
+def _session_files():
+    """Every autosave on disk, of running and finished instances alike"""
+    return (glob.glob(os.path.join(AUTOSAVE_DIR, 'session-*.json')) +
+            glob.glob(os.path.join(AUTOSAVE_DIR, 'run-*', 'session-*.json')))
+
+
+def find_autosaves():
+    """Autosaved sessions of instances that are no longer running, oldest first.
+
+    The run directories they are in stay locked by this process until
+    release_orphans, so an instance starting at the same time cannot claim
+    them as well. Files from before run directories are included too.
+    """
+    own = run_dir()
+    paths = glob.glob(os.path.join(AUTOSAVE_DIR, 'session-*.json'))
+    for directory in glob.glob(os.path.join(AUTOSAVE_DIR, 'run-*')):
+        if directory == own or directory in _orphans:
+            continue
+        try:
+            f = open(os.path.join(directory, LOCK_NAME), 'r+')
+        except OSError:
+            continue  # Not a run directory, or its owner is still creating it
+        if not _try_lock(f):
+            f.close()  # Still running
+            continue
+        _orphans[directory] = f
+        paths.extend(glob.glob(os.path.join(directory, 'session-*.json')))
+    return sorted(paths, key=os.path.getmtime)
+
+
+def adopt_autosave(path):
+    """Move an autosave found by find_autosaves into this process's directory"""
+    new_path = os.path.join(run_dir(), os.path.basename(path))
+    os.replace(path, new_path)
+    return new_path
+
+
+def release_orphans():
+    """Unlock the runs claimed by find_autosaves and remove their directories.
+
+    A directory that still holds a session (e.g. one that could not be
+    moved) is left in place and offered again next time.
+    """
+    for directory, f in _orphans.items():
+        f.close()
+        try:
+            os.remove(os.path.join(directory, LOCK_NAME))
+            os.rmdir(directory)
+        except OSError:
+            pass
+    _orphans.clear()
+
+
+def load_autosave(path):
+    """Read an autosave and put the attachment data back inline"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    pdfs = data.get("pdfs", {})
+    blobs = pdfs.pop("blobs", {})
+    pdfs["data"] = {}
+    for file_path, digest in blobs.items():
+        try:
+            with open(os.path.join(BLOB_DIR, digest), 'r', encoding='utf-8') as f:
+                pdfs["data"][file_path] = f.read()
+        except OSError:
+            pass  # Missing blob, the attachment is skipped on restore
+    return data
+
+
+def prune_blobs():
+    """Delete attachment blobs that no autosave refers to anymore"""
+    used = set()
+    for path in _session_files():
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                used.update(json.load(f).get("pdfs", {}).get("blobs", {}).values())
+        except (OSError, ValueError):
+            continue
+    # Another running instance writes a blob just before the session that uses it
+    cutoff = time.time() - BLOB_GRACE
+    for blob_path in glob.glob(os.path.join(BLOB_DIR, '*')):
+        if os.path.basename(blob_path) not in used:
+            try:
+                if os.path.getmtime(blob_path) < cutoff:
+                    os.remove(blob_path)
+            except OSError:
+                pass
+
+
+class BackgroundWriter:
+    """Runs file writes on one background thread.
+
+    Jobs are keyed (usually by target path); if a newer job for the same
+    key arrives before the old one started, only the newer one runs.
+    """
+
+    def __init__(self):
+        self._jobs = {}  # {key: job}, insertion ordered
+        self._cond = threading.Condition()
+        self._busy = False
+        self._thread = threading.Thread(target=self._run, name="file-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, job):
+        with self._cond:
+            self._jobs.pop(key, None)
+            self._jobs[key] = job
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every submitted job has run"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._jobs or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+                key = next(iter(self._jobs))
+                job = self._jobs.pop(key)
+                self._busy = True
+            try:
+                job()
+            except Exception as e:
+                print(f"Background write failed for {key}: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+
+class Autosaver:
+    """Debounced autosave of one chat session.
+
+    Changes only (re)start a timer on the Tk thread. When it fires, a
+    snapshot of the session is taken (cheap: lists and shared strings) and
+    everything else, JSON encoding, hashing and disk writes, happens on the
+    writer thread. Attachments are stored once as content-addressed blobs,
+    so routine saves never rewrite large files.
+    """
+
+    def __init__(self, root, writer, path, build_snapshot, delay_ms=DEBOUNCE_MS):
+        self.root = root
+        self.writer = writer
+        self.path = path
+        self.build_snapshot = build_snapshot  # Returns save data, or None when empty
+        self.delay_ms = delay_ms
+        self._after_id = None
+        self._first_change = None
+        self._digests = {}  # {attachment path: (data, digest)}, touched by the writer thread only
+
+    def schedule(self):
+        """Note a change; the save happens once changes pause"""
+        now = time.monotonic()
+        if self._after_id is not None:
+            if (now - self._first_change) * 1000 >= MAX_DELAY_MS:
+                return  # Keep the pending save instead of postponing it again
+            self.root.after_cancel(self._after_id)
+        else:
+            self._first_change = now
+        self._after_id = self.root.after(self.delay_ms, self.save_now)
+
+    def save_now(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        data = self.build_snapshot()
+        if data is None:
+            self.writer.submit(self.path, self._remove)
+        else:
+            self.writer.submit(self.path, lambda: self._write(data))
+
+    def flush(self):
+        """Save right away if a save is pending"""
+        if self._after_id is not None:
+            self.save_now()
+
+    def discard(self):
+        """Stop autosaving and delete the file"""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self.writer.submit(self.path, self._remove)
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _write(self, data):
+        # Swap inline attachment data for references to blob files
+        pdfs = data.get("pdfs", {})
+        inline = pdfs.pop("data", {})
+        blobs = {}
+        for file_path, b64_data in inline.items():
+            if b64_data is None:
+                continue
+            cached = self._digests.get(file_path)
+            if cached and cached[0] is b64_data:
+                digest = cached[1]
+            else:
+                digest = hashlib.sha256(b64_data.encode('ascii')).hexdigest()
+            blobs[file_path] = digest
+            blob_path = os.path.join(BLOB_DIR, digest)
+            if not os.path.exists(blob_path):
+                write_atomic(blob_path, lambda f: f.write(b64_data))
+        self._digests = {path: (inline[path], digest) for path, digest in blobs.items()}
+        pdfs["blobs"] = blobs
+        write_json_atomic(self.path, data)
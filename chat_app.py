@@ -1,46 +1,170 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog
-import anthropic # type: ignore
 import json
 import os
+import threading
 from chat_display import EditableChatDisplay
 from multiline_input import MultilineInput
-import base64
+from conversation_tree import ConversationTree
+from context_summarizer import RollingSummarizer
+from chat_services import ChatServices, create_client
+from autosave import Autosaver, load_autosave, new_autosave_path, write_json_atomic
+from fanout import FanoutWindow, FanoutListener, parse_configs
+from pdf_ingest import MAX_PDF_PAGES, MAX_REQUEST_BYTES, IngestJob, ingest_pdf
+from image_ingest import IMAGE_EXTENSIONS, ingest_image, is_image
+from usage_ledger import describe_request, make_entry, short_summary
+from context_policy import POLICIES, DEFAULT_POLICY, context_flags, split_pinned, pinned_block
+from doc_mapreduce import (NotesCache, conversation_excerpt, document_digest, group_documents, map_documents,
+                           notes_missing, reduce_message)
+import time
+
+API_KEY_MISSING = "Anthropic API key needed! Paste your key into api_key.txt in the same directory as this program, or generate one first at https://console.anthropic.com/dashboard"
+DEFAULT_TITLE = "Claude Chat Interface"
+MODELS = [
+    "claude-3-5-sonnet-20241022",
+    "claude-3-5-haiku-20241022",
+    "claude-3-opus-20240229"
+]
+DEFAULT_MODEL = MODELS[0]
+DEFAULT_FANOUT_CONFIGS = "claude-3-5-sonnet-20241022\nclaude-3-5-haiku-20241022\nclaude-3-5-sonnet-20241022 0.2\n"
+
+
+def usage_to_dict(usage):
+    """Plain dict of a response's token counts, for storing with the reply"""
+    if usage is None:
+        return None
+    counts = {}
+    for field in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+        value = getattr(usage, field, None)
+        if value is not None:
+            counts[field] = value
+    return counts
 
 class ClaudeChatApp:
-    def __init__(self, root):
+    """One chat session: its conversation, settings and attachments.
+
+    Sessions can run on their own in the root window, or several can share
+    one ChatServices (API client, attachment store, worker threads) with
+    each one built inside its own container, e.g. a notebook tab.
+    """
+    def __init__(self, root, services=None, container=None, on_title=None, autosave_path=None):
         self.root = root
-        self.root.title("Claude Chat Interface")
-        self.root.geometry("750x800")
+        self.container = container if container is not None else root
+        self.on_title = on_title
+        if container is None:
+            self.root.geometry("750x800")
         
-        api_key = self.load_api_key()
-        self.client = anthropic.Anthropic(api_key=api_key) if api_key else None
+        # Conversation history as a tree of branches, full_history is the active branch
+        self.tree = ConversationTree()
+        
+        self.services = services if services else ChatServices(root, create_client())
+        self.client = self.services.client
+        if not self.client:
+            # Add a system message to the history about needing an API key
+            self.append_message("system", API_KEY_MISSING)
+        # Optional compaction: messages leaving the context window get summarized
+        self.summarizer = RollingSummarizer(self.client, on_usage=self._on_summary_usage) if self.client else None
+        self.ledger = []  # Token usage and cost of every request, see usage_ledger.py
         
-        # Initialize PDF tracking as lists/dicts instead of single values
-        self.pdf_files = {}  # Dictionary to store {filename: base64_data}
-        self.selected_pdfs = []  # List to store selected PDF paths in order
+        # Attachment data lives in the shared store, this session keeps its own selection
+        self.attachments = self.services.attachments
+        self.selected_pdfs = []  # Selected attachment paths (PDFs and images) in order
+        self.loading_pdfs = []  # IngestJobs still being read, listed after the selected PDFs
+        self.doc_notes = NotesCache()  # Map-reduce notes per document group and model
+        self._doc_digests = {}  # {path: (data, digest)}, so large files are hashed once
+        self._reply_notes = {}  # {reply node: notes cache keys its request used}
         
         self.context_size = 10
         self.api_context = []
-        self.full_history = []
+        self.pending_replies = set()  # Reply nodes still streaming in
+        self._stream_lock = threading.Lock()
+        self._stream_buffers = {}  # {reply node: text received but not yet shown}
+        self.reply_listeners = {}  # {reply node: FanoutListener}, for replies shown elsewhere too
+        self.fanout_window = None
+        self.fanout_configs = DEFAULT_FANOUT_CONFIGS
+        self._prebuilt = None  # (request_prefix_key, request base) built while typing
+        self._prebuild_after = None
+        self.closed = False
+        
+        # Debounced background autosave, triggered by changes to the conversation
+        self.autosaver = Autosaver(
+            self.root,
+            self.services.writer,
+            autosave_path or new_autosave_path(),
+            self.build_autosave
+        )
         
         self.create_widgets()
         self.create_pdf_frame()  # Add this line after create_widgets()
+        self.set_title(DEFAULT_TITLE)
+        self.refresh_display()
+
+    def set_title(self, title):
+        self.title = title
+        if self.on_title:
+            self.on_title(self, title)
+        else:
+            self.root.title(title)
+
+    def close(self, keep_autosave=False):
+        """Release what this session holds in the shared services.
+
+        The autosave is deleted unless keep_autosave is set, e.g. when the
+        whole window closes and the session should be offered next time.
+        """
+        if keep_autosave:
+            self.autosaver.flush()
+        else:
+            self.autosaver.discard()
+        self.closed = True
+        if self.summarizer:
+            self.summarizer.stop()
+        for pdf_path in self.selected_pdfs:
+            self.attachments.release(pdf_path)
+        self.selected_pdfs.clear()
+        for job in self.loading_pdfs:
+            job.cancelled = True
+        if self.fanout_window is not None and self.fanout_window.winfo_exists():
+            self.fanout_window.destroy()
+
+    @property
+    def pdf_files(self):
+        """Selected attachments as {path: base64_data}"""
+        return {path: self.attachments.get(path) for path in self.selected_pdfs}
+
+    @property
+    def full_history(self):
+        """Messages on the currently selected branch of the conversation"""
+        return self.tree.messages()
+
+    def append_message(self, role, content, parent=None):
+        """Add a message to the conversation tree (default: end of the active branch)"""
+        return self.tree.append(role, content, parent=parent)
 
     def create_pdf_frame(self):
         """Create frame for PDF selection controls with list of files"""
         # Create main frame
-        pdf_frame = ttk.LabelFrame(self.root, text="PDF Documents")
+        pdf_frame = ttk.LabelFrame(self.container, text="PDFs and Images")
         pdf_frame.pack(padx=10, pady=5, fill=tk.X)
         
         # Button frame for controls
         button_frame = ttk.Frame(pdf_frame)
         button_frame.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
         
-        # Add PDF button
-        self.pdf_button = ttk.Button(button_frame, text="Add PDF", command=self.select_pdf)
+        # Add PDF/image button
+        self.pdf_button = ttk.Button(button_frame, text="Add File", command=self.select_pdf)
         self.pdf_button.pack(side=tk.LEFT, padx=5)
         
+        # Ask each document separately, then merge, instead of one request with all of them
+        self.mapreduce_var = tk.BooleanVar(value=False)
+        self.mapreduce_check = ttk.Checkbutton(
+            button_frame,
+            text="Map-reduce",
+            variable=self.mapreduce_var,
+            command=self.autosaver.schedule
+        )
+        self.mapreduce_check.pack(side=tk.LEFT, padx=5)
+        
         # Clear All button
         self.clear_pdf_button = ttk.Button(button_frame, text="Clear All", command=self.clear_all_pdfs)
         self.clear_pdf_button.pack(side=tk.RIGHT, padx=5)
@@ -62,35 +186,6 @@ class ClaudeChatApp:
         self.pdf_listbox.bind('<Button-3>', self.remove_selected_pdf)
 
 
-    def select_pdf(self):
-        """Handle PDF file selection"""
-        file_path = filedialog.askopenfilename(
-            filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
-        )
-        if file_path:
-            try:
-                with open(file_path, 'rb') as f:
-                    pdf_data = f.read()
-                    self.current_pdf_path = file_path
-                    self.current_pdf_data = base64.b64encode(pdf_data).decode('utf-8')
-                    filename = os.path.basename(file_path)
-                    self.pdf_label.configure(text=f"Current File: {filename}")
-            except Exception as e:
-                self.full_history.append({
-                    "role": "system", 
-                    "content": f"Error loading PDF: {str(e)}"
-                })
-                self.refresh_display()
-                self.current_pdf_path = None
-                self.current_pdf_data = None
-                self.pdf_label.configure(text="Current: None")
-
-    def clear_pdf(self):
-        """Clear the current PDF selection"""
-        self.current_pdf_path = None
-        self.current_pdf_data = None
-        self.pdf_label.configure(text="Current: None")
-
     def get_context_size(self):
         """Helper method to safely get current context size"""
         try:
@@ -98,38 +193,38 @@ class ClaudeChatApp:
         except (ValueError, AttributeError):
             return 10  # default value
 
-    def load_api_key(self):
-        """Load API key from file or create the file if it doesn't exist."""
-        try:
-            # Try to read the API key
-            with open('api_key.txt', 'r') as f:
-                api_key = f.read().strip()
-                
-            # Check if the file is empty
-            if not api_key:
-                raise FileNotFoundError()
-                
-            return api_key
-            
-        except FileNotFoundError:
-            # Create the file if it doesn't exist
-            with open('api_key.txt', 'w') as f:
-                pass  # Create empty file
-                
-            # Add a system message to the history about needing an API key
-            if not hasattr(self, 'full_history'):
-                self.full_history = []
-            self.full_history.append({
-                "role": "system",
-                "content": "Anthropic API key needed! Paste your key into api_key.txt in the same directory as this program, or generate one first at https://console.anthropic.com/dashboard"
-            })
-            
-            return None
-
     def handle_message_edit(self, index, new_content):
-        # Update the content in full_history
+        """Editing a message forks a new branch, the original stays reachable"""
+        if 0 <= index < len(self.full_history):
+            self.tree.fork(index, new_content)
+            # Rebuild after the edit event finishes, the edited widget gets replaced
+            self.root.after_idle(self.refresh_display)
+
+    def handle_branch_switch(self, index, delta):
+        """Show another version of the message at index"""
         if 0 <= index < len(self.full_history):
-            self.full_history[index]["content"] = new_content
+            self.tree.switch_branch(index, delta)
+            self.refresh_display()
+
+    def regenerate_from(self, index):
+        """Ask for a new reply at index, keeping the previous one as a branch"""
+        path = self.tree.path()
+        if not 0 <= index < len(path):
+            return
+        node = path[index]
+        # Replies are regenerated from the prompt that produced them
+        user_node = node.parent if node.role == "assistant" else node
+        if user_node.role != "user":
+            return
+        if not self.client:
+            self.append_message("system", "Cannot send message: No valid API key found. Please add your API key to api_key.txt")
+            self.refresh_display()
+            return
+        if self.pending_replies:
+            return
+        self.tree.truncate_at(user_node)
+        self.request_reply(user_node)
+        self.refresh_display()
         
     def setup_tags(self):
         self.chat_display.tag_configure("active_context", background="#e6f3ff")
@@ -139,9 +234,39 @@ class ClaudeChatApp:
         
     def create_widgets(self):
         # Top settings frame
-        settings_frame = ttk.LabelFrame(self.root, text="Settings")
+        settings_frame = ttk.LabelFrame(self.container, text="Settings")
         settings_frame.pack(padx=10, pady=5, fill=tk.X)
         
+        # Model selection, on its own row above the other settings
+        model_frame = ttk.Frame(settings_frame)
+        model_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        ttk.Label(model_frame, text="Model:").pack(side=tk.LEFT, padx=5)
+        self.model_var = tk.StringVar(value=DEFAULT_MODEL)
+        self.model_combo = ttk.Combobox(
+            model_frame,
+            values=MODELS,
+            width=30,
+            textvariable=self.model_var
+        )
+        self.model_combo.pack(side=tk.LEFT, padx=5)
+        
+        # Which messages leave the context first; pinned messages never do
+        ttk.Label(model_frame, text="Eviction:").pack(side=tk.LEFT, padx=5)
+        self.policy_var = tk.StringVar(value=POLICIES[DEFAULT_POLICY])
+        self.policy_combo = ttk.Combobox(
+            model_frame,
+            values=list(POLICIES.values()),
+            width=20,
+            state="readonly",
+            textvariable=self.policy_var
+        )
+        self.policy_combo.pack(side=tk.LEFT, padx=5)
+        self.policy_combo.bind('<<ComboboxSelected>>', lambda e: (self.update_context_size(), self.autosaver.schedule()))
+        self.fanout_button = ttk.Button(model_frame, text="Compare Models...", command=self.open_fanout)
+        self.fanout_button.pack(side=tk.RIGHT, padx=5)
+        self.usage_label = ttk.Label(model_frame, text="")
+        self.usage_label.pack(side=tk.RIGHT, padx=5)
+        
         # Temperature control
         ttk.Label(settings_frame, text="Temperature:").pack(side=tk.LEFT, padx=5)
         self.temperature_var = tk.StringVar(value="1.0")
@@ -182,6 +307,16 @@ class ClaudeChatApp:
         )
         self.context_size_spinbox.pack(side=tk.LEFT, padx=5)
         
+        # Summarize messages that leave the context window instead of dropping them
+        self.summarize_var = tk.BooleanVar(value=False)
+        self.summarize_check = ttk.Checkbutton(
+            settings_frame,
+            text="Summarize",
+            variable=self.summarize_var,
+            command=self.on_summarize_toggle
+        )
+        self.summarize_check.pack(side=tk.LEFT, padx=5)
+        
         # Save/Load buttons
         self.save_button = ttk.Button(settings_frame, text="Save Chat", command=self.save_conversation)
         self.save_button.pack(side=tk.RIGHT, padx=5)
@@ -194,7 +329,7 @@ class ClaudeChatApp:
         
         # Chat display area
         # Create a container frame for fixed height
-        self.chat_container = ttk.Frame(self.root, height=400)
+        self.chat_container = ttk.Frame(self.container, height=400)
         self.chat_container.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
         self.chat_container.pack_propagate(False)  # Prevent size changes
         
@@ -202,11 +337,16 @@ class ClaudeChatApp:
         self.chat_display = EditableChatDisplay(
             self.chat_container,
             get_context_size=self.get_context_size,
-            on_message_edit=self.handle_message_edit
+            on_message_edit=self.handle_message_edit,
+            on_switch_branch=self.handle_branch_switch,
+            on_regenerate=self.regenerate_from,
+            on_toggle_pin=self.toggle_pin,
+            get_context_flags=lambda: self.context_flags(self.tree.path()),
+            can_edit=lambda node: node not in self.pending_replies  # Streaming replies are read-only
         )
         self.chat_display.pack(fill=tk.BOTH, expand=True)
         
-        self.input_frame = ttk.Frame(self.root)
+        self.input_frame = ttk.Frame(self.container)
         self.input_frame.pack(padx=10, pady=5, fill=tk.X)
         
         # Using MultilineInput with submit callback
@@ -217,16 +357,50 @@ class ClaudeChatApp:
             max_height=150
         )
         self.message_input.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.message_input.bind('<KeyRelease>', self._on_input_key, add='+')
         
         self.send_button = ttk.Button(self.input_frame, text="Send", command=self.send_message)
         self.send_button.pack(side=tk.RIGHT, padx=(5, 0))
         
         # System message area
-        system_frame = ttk.LabelFrame(self.root, text="Persistent Context/Instructions")
+        system_frame = ttk.LabelFrame(self.container, text="Persistent Context/Instructions")
         system_frame.pack(padx=10, pady=3, fill=tk.X)
         
         self.system_input = scrolledtext.ScrolledText(system_frame, wrap=tk.WORD, height=5)
         self.system_input.pack(padx=5, pady=10, fill=tk.X)
+        self.system_input.bind('<KeyRelease>', lambda e: self.autosaver.schedule(), add='+')
+
+    def build_save_data(self):
+        """Snapshot the session for saving; cheap, the strings are shared not copied"""
+        return {
+            # Replies still streaming would come back empty, see to_api_messages
+            "tree": self.tree.to_dict(skip=self.pending_replies),
+            "system_message": self.system_input.get("1.0", tk.END).strip(),
+            "settings": {
+                "model": self.model_var.get(),
+                "temperature": self.temperature_var.get(),
+                "max_tokens": self.tokens_var.get(),
+                "context_size": self.context_size_var.get(),
+                "summarize": self.summarize_var.get(),
+                "policy": self.policy,
+                "mapreduce": self.mapreduce_var.get()
+            },
+            "ledger": list(self.ledger),
+            "pdfs": {
+                "paths": list(self.selected_pdfs),
+                "data": self.pdf_files,
+                "media_types": {path: self.attachments.media_type(path) for path in self.selected_pdfs},
+                "pages": {path: self.attachments.pages(path) for path in self.selected_pdfs}
+            }
+        }
+
+    def build_autosave(self):
+        """Snapshot for autosave, or None when there is nothing worth keeping"""
+        has_messages = any(node.role in ("user", "assistant") for node in self.tree.nodes.values())
+        has_system = self.system_input.get("1.0", "end-1c").strip()
+        if not (has_messages or has_system or self.selected_pdfs):
+            return None
+        return self.build_save_data()
 
     def save_conversation(self):
         file_path = filedialog.asksaveasfilename(
@@ -234,32 +408,15 @@ class ClaudeChatApp:
             filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
         )
         if file_path:
-            current_history = []
-            for i, msg in enumerate(self.full_history):
-                if i < len(self.chat_display.messages):
-                    current_content = self.chat_display.messages[i].get_content()
-                    current_history.append({
-                        "role": msg["role"],
-                        "content": current_content
-                    })
-                else:
-                    current_history.append(msg)
+            save_data = self.build_save_data()
             
-            save_data = {
-                "history": current_history,
-                "system_message": self.system_input.get("1.0", tk.END).strip(),
-                "settings": {
-                    "temperature": self.temperature_var.get(),
-                    "max_tokens": self.tokens_var.get(),
-                    "context_size": self.context_size_var.get()
-                },
-                "pdfs": {
-                    "paths": self.selected_pdfs,
-                    "data": self.pdf_files
-                }
-            }
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(save_data, f)
+            # Encode and write on the writer thread, the UI stays responsive
+            def write():
+                try:
+                    write_json_atomic(file_path, save_data)
+                except Exception as e:
+                    self.services.call_soon(self.show_error, f"Error saving file: {str(e)}")
+            self.services.writer.submit(file_path, write)
     
     def load_conversation(self):
         file_path = filedialog.askopenfilename(
@@ -267,204 +424,680 @@ class ClaudeChatApp:
         )
         if file_path:
             try:
-                self.new_chat()
-
                 with open(file_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    self.full_history = data["history"]
-                    
-                    if "system_message" in data:
-                        self.system_input.delete("1.0", tk.END)
-                        self.system_input.insert("1.0", data["system_message"])
-                    
-                    if "settings" in data:
-                        settings = data["settings"]
-                        self.temperature_var.set(settings.get("temperature", "0.7"))
-                        self.tokens_var.set(settings.get("max_tokens", "1024"))
-                        self.context_size_var.set(settings.get("context_size", "10"))
-                        self.update_context_size()
-                    
-                    # Load PDF data if present
-                    if "pdfs" in data and isinstance(data["pdfs"], dict):
-                        pdf_paths = data["pdfs"].get("paths", [])
-                        pdf_data = data["pdfs"].get("data", {})
-                        
-                        self.pdf_files.clear()
-                        self.selected_pdfs.clear()
-                        self.pdf_listbox.delete(0, tk.END)
-                        
-                        for path in pdf_paths:
-                            if os.path.exists(path) and path in pdf_data:
-                                self.pdf_files[path] = pdf_data[path]
-                                self.selected_pdfs.append(path)
-                                filename = os.path.basename(path)
-                                self.pdf_listbox.insert(tk.END, filename)
+                self.apply_save_data(data)
                                 
                 file_name = os.path.basename(file_path)
-                self.root.title(f"Claude - Loaded: {file_name}")
-                    
-                self.refresh_display()
+                self.set_title(f"Claude - Loaded: {file_name}")
             except Exception as e:
-                self.full_history.append({"role": "system", "content": f"Error loading file: {str(e)}"})
-                self.refresh_display()
+                self.show_error(f"Error loading file: {str(e)}")
+    
+    def restore_autosave(self, path):
+        """Continue a session autosaved by an earlier run"""
+        try:
+            self.apply_save_data(load_autosave(path))
+        except Exception as e:
+            self.show_error(f"Error restoring autosave: {str(e)}")
+    
+    def apply_save_data(self, data):
+        """Replace the session with saved data"""
+        self.reset_session()
+        
+        # Older saves only have the flat history of a single branch
+        if "tree" in data:
+            self.tree = ConversationTree.from_dict(data["tree"])
+        else:
+            self.tree = ConversationTree.from_history(data["history"])
+        
+        if "system_message" in data:
+            self.system_input.delete("1.0", tk.END)
+            self.system_input.insert("1.0", data["system_message"])
+        
+        if "settings" in data:
+            settings = data["settings"]
+            self.model_var.set(settings.get("model", DEFAULT_MODEL))
+            self.temperature_var.set(settings.get("temperature", "0.7"))
+            self.tokens_var.set(settings.get("max_tokens", "1024"))
+            self.context_size_var.set(settings.get("context_size", "10"))
+            self.summarize_var.set(settings.get("summarize", False))
+            self.policy_var.set(POLICIES.get(settings.get("policy"), POLICIES[DEFAULT_POLICY]))
+            self.mapreduce_var.set(settings.get("mapreduce", False))
+            self.update_policy_state()
+            self.update_context_size()
+        
+        self.ledger = list(data.get("ledger", []))
+        self.update_usage_label()
+        
+        # Load PDF data if present
+        if "pdfs" in data and isinstance(data["pdfs"], dict):
+            pdf_paths = data["pdfs"].get("paths", [])
+            pdf_data = data["pdfs"].get("data", {})
+            media_types = data["pdfs"].get("media_types", {})
+            pages = data["pdfs"].get("pages", {})  # Older saves have no page counts
+            
+            for path in pdf_paths:
+                if os.path.exists(path) and path in pdf_data:
+                    self.add_attachment(path, pdf_data[path], media_types.get(path, "application/pdf"),
+                                        pages.get(path))
+        
+        self.refresh_display()
+    
+    def show_error(self, text):
+        """Show a notice in the chat"""
+        self.append_message("system", text)
+        self.refresh_display()
     
     def update_context_size(self):
         try:
             self.context_size = max(0, int(self.context_size_var.get()))
             # Add this line to refresh context indicators when context size changes
             self.chat_display.refresh_context_indicators()
+            self.update_summary()
         except ValueError:
-            self.full_history.append({"role": "system", "content": "Error: Invalid context size value"})
+            self.append_message("system", "Error: Invalid context size value")
             self.refresh_display()
     
-    def get_context_messages(self):
-        if self.context_size == 0:
-            return []
+    def on_summarize_toggle(self):
+        self.update_policy_state()
+        self.chat_display.refresh_context_indicators()
+        self.update_summary()
+    
+    def update_policy_state(self):
+        """The eviction policy does not apply while older messages are summarized"""
+        if self.summarize_var.get():
+            self.policy_combo.state(['disabled'])
+        else:
+            self.policy_combo.state(['!disabled'])
+    
+    @property
+    def policy(self):
+        """Id of the selected eviction policy"""
+        label = self.policy_var.get()
+        return next((key for key, value in POLICIES.items() if value == label), DEFAULT_POLICY)
+    
+    def context_flags(self, nodes):
+        """Which of nodes go into the request verbatim, under the eviction policy and pins"""
+        pinned = [self.tree.is_pinned(node) for node in nodes]
+        if self.summarizing:
+            # Pinned messages and everything after the summary window starts
+            start = self.summary_window(nodes)[1]
+            return [pinned[i] or i >= start for i in range(len(nodes))]
+        return context_flags([node.role for node in nodes], pinned, self.context_size, self.policy)
+    
+    @property
+    def summarizing(self):
+        return bool(self.summarizer and self.summarize_var.get())
+    
+    def summary_window(self, nodes):
+        """Return (summary, index of the first message sent as-is) when summarizing.
+
+        Older messages are represented by the rolling summary. Anything
+        evicted since its last update is still sent as-is, up to one extra
+        window.
+        """
+        boundary = max(0, len(nodes) - self.context_size)
+        summary, covered = self.summarizer.summary_for(nodes, boundary)
+        return summary, max(covered, boundary - self.context_size)
+    
+    def get_context_messages(self, nodes=None):
+        """Return (pinned messages that left the window, API messages in the window)"""
+        if nodes is None:
+            nodes = self.tree.path()
+        pinned = [self.tree.is_pinned(node) for node in nodes]
+        early, window = split_pinned(self.context_flags(nodes), pinned)
+        return ([nodes[i].message for i in early],
+                self.to_api_messages([nodes[i].message for i in window]))
+    
+    def toggle_pin(self, index):
+        """Pin or unpin the message at index of the active branch"""
+        path = self.tree.path()
+        if not 0 <= index < len(path):
+            return
+        node = path[index]
+        pinned = not self.tree.is_pinned(node)
+        self.tree.set_pinned(node, pinned)
+        self.chat_display.messages[index].set_pinned(pinned)
+        self.chat_display.refresh_context_indicators()
+        self.autosaver.schedule()
+    
+    def to_api_messages(self, history):
+        """Convert history entries to API messages, notices shown as "system" are not sent.
+
+        Empty messages, e.g. a reply interrupted before any text arrived, are
+        skipped too; the API rejects them.
+        """
+        context_messages = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in history
+            if msg["role"] in ("user", "assistant") and msg["content"].strip()
+        ]
         
-        # Get the last context_size messages from full_history
-        context_slice = self.full_history[-self.context_size:]
-        
-        # Create a list of messages with current edited content
-        context_messages = []
-        start_idx = len(self.full_history) - len(context_slice)
-        
-        for i, msg in enumerate(context_slice):
-            display_idx = start_idx + i
-            if display_idx < len(self.chat_display.messages):
-                # Use the current edited content from the display
-                edited_content = self.chat_display.messages[display_idx].get_content()
-                context_messages.append({
-                    "role": msg["role"],
-                    "content": edited_content
-                })
-            else:
-                # Use the original content for any new messages
-                context_messages.append(msg)
+        # The API expects the conversation to open with a user turn
+        while context_messages and context_messages[0]["role"] != "user":
+            context_messages.pop(0)
         
         return context_messages
     
     def send_message(self):
         """Handle sending a message to Claude API with support for multiple PDFs"""
         if not self.client:
-            self.full_history.append({
-                "role": "system",
-                "content": "Cannot send message: No valid API key found. Please add your API key to api_key.txt"
-            })
+            self.append_message("system", "Cannot send message: No valid API key found. Please add your API key to api_key.txt")
             self.refresh_display()
             return
             
         user_msg_content = self.message_input.get().strip()
-        if not user_msg_content:
+        if not user_msg_content or self.pending_replies:
+            return
+        if self.loading_pdfs:
+            self.show_error(f"Please wait, {len(self.loading_pdfs)} file(s) still loading")
             return
             
         self.message_input.delete()
         
+        # Usually the request was already built while typing
+        base = self.take_prebuilt(self.tree.leaf())
+        user_node = self.append_message("user", user_msg_content)
+        self.request_reply(user_node, base)
+        self.refresh_display()
+
+    def request_prefix_key(self, parent):
+        """Everything a request after parent depends on besides the new text"""
+        return (
+            self.tree, self.tree.version, parent,
+            self.model_var.get(), self.temperature_var.get(), self.tokens_var.get(),
+            self.context_size, self.policy, self.summarize_var.get(), self.mapreduce_var.get(),
+            self.summarizer.version if self.summarizer else 0,
+            self.system_input.get("1.0", tk.END).strip(),
+            tuple(self.selected_pdfs)
+        )
+
+    def _on_input_key(self, event):
+        # Typing usually ends in a send: warm the connection and prepare the request
+        if not self.client or self.pending_replies or self.loading_pdfs:
+            return
+        self.services.warm_up()
+        if self._prebuild_after is None:
+            self._prebuild_after = self.root.after_idle(self.prebuild_request)
+
+    def prebuild_request(self):
+        """Build the request prefix for the next message ahead of Send"""
+        self._prebuild_after = None
+        if self.closed:
+            return
+        parent = self.tree.leaf()
+        key = self.request_prefix_key(parent)
+        if self._prebuilt is not None and self._prebuilt[0] == key:
+            return
         try:
-            temperature = float(self.temperature_var.get())
-            max_tokens = int(self.tokens_var.get())
-            system_message = self.system_input.get("1.0", tk.END).strip()
-            
-            # Get context messages first
-            context_messages = self.get_context_messages()
-            
-            # Prepare the new user message with PDFs if present
-            if self.pdf_files:
-                # Create content list starting with PDF documents
-                content_list = []
-                for pdf_path in self.selected_pdfs:
-                    content_list.append({
-                        "type": "document",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "application/pdf",
-                            "data": self.pdf_files[pdf_path]
-                        },
-                        "cache_control": {"type": "ephemeral"}
-                    })
-                # Add the user's text message
-                content_list.append({
+            self._prebuilt = (key, self.build_request_base(parent))
+        except Exception:
+            self._prebuilt = None  # Reported when the message is actually sent
+
+    def take_prebuilt(self, parent):
+        """The prebuilt prefix if nothing it depends on has changed since, else None"""
+        prebuilt, self._prebuilt = self._prebuilt, None
+        if prebuilt is not None and prebuilt[0] == self.request_prefix_key(parent):
+            return prebuilt[1]
+        return None
+
+    def build_api_params(self, user_node, base=None):
+        """Build the request for replying to user_node on its branch"""
+        if base is None:
+            base = self.build_request_base(user_node.parent)
+        return self.complete_request(base, user_node.content)
+
+    def complete_request(self, base, text):
+        """Add the new user text to a request prefix, leaving the prefix untouched"""
+        documents = base["documents"]
+        if documents:
+            # Documents first, then the user's text
+            new_message = {
+                "role": "user",
+                "content": documents + [{"type": "text", "text": text}]
+            }
+        else:
+            new_message = {
+                "role": "user",
+                "content": text
+            }
+        api_params = dict(base["params"])
+        api_params["messages"] = base["params"]["messages"] + [new_message]
+        return api_params
+
+    def build_request_base(self, parent):
+        """Build everything of a request after parent except the new user text.
+
+        Returns {"params": api params with the context messages, "documents":
+        document blocks for the new message}; see complete_request.
+        """
+        temperature = float(self.temperature_var.get())
+        max_tokens = int(self.tokens_var.get())
+        system_message = self.system_input.get("1.0", tk.END).strip()
+        
+        # Context comes from the branch leading to this prompt, shared with sibling branches
+        history = self.tree.path_to(parent)
+        # Pinned messages are kept verbatim, even where the summary covers them
+        summary = self.summary_window(history)[0] if self.summarizing else ""
+        pinned_messages, context_messages = self.get_context_messages(history)
+        if context_messages:
+            # Cache breakpoint at the end of the shared prefix so alternatives reuse it
+            last = context_messages[-1]
+            context_messages[-1] = {
+                "role": last["role"],
+                "content": [{
                     "type": "text",
-                    "text": user_msg_content
+                    "text": last["content"],
+                    "cache_control": {"type": "ephemeral"}
+                }]
+            }
+        
+        # Prepare the documents and images for the new user message. In map-reduce
+        # mode PDFs are read by separate requests instead, see build_map_step
+        inline = self.inline_attachments()
+        pdf_files = self.pdf_files
+        total = sum(len(pdf_files[path]) for path in inline)
+        if total > MAX_REQUEST_BYTES:
+            raise ValueError(f"The attachments add up to {total / (1024 * 1024):.1f} MB encoded, "
+                             f"requests are limited to {MAX_REQUEST_BYTES // (1024 * 1024)} MB; remove some")
+        pages = sum(self.attachments.pages(path) for path in inline)
+        if pages > MAX_PDF_PAGES:
+            raise ValueError(f"The PDFs have {pages} pages together, requests are limited to "
+                             f"{MAX_PDF_PAGES}; remove some")
+        documents = []
+        if inline:
+            for pdf_path in inline:
+                media_type = self.attachments.media_type(pdf_path)
+                documents.append({
+                    "type": "image" if media_type.startswith("image/") else "document",
+                    "source": {
+                        "type": "base64",
+                        "media_type": media_type,
+                        "data": pdf_files[pdf_path]
+                    }
                 })
-                new_message = {
-                    "role": "user",
-                    "content": content_list
-                }
-            else:
-                new_message = {
-                    "role": "user",
-                    "content": user_msg_content
-                }
-            
-            # Add the new message to context or use it alone if no context
-            messages_for_api = context_messages if context_messages else []
-            messages_for_api.append(new_message)
-            
-            # Store simplified version in history for display
-            self.full_history.append({
-                "role": "user",
-                "content": user_msg_content
+            # One breakpoint after the last document caches all of them
+            documents[-1]["cache_control"] = {"type": "ephemeral"}
+        
+        api_params = {
+            "model": self.model_var.get(),
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": context_messages
+        }
+        
+        system_blocks = []
+        if system_message:
+            system_blocks.append({"type": "text", "text": system_message})
+        if pinned_messages:
+            # Before the summary and the conversation: it only changes when a pin
+            # is added or leaves the window, so it stays cached in between
+            system_blocks.append(pinned_block(pinned_messages))
+        if summary:
+            system_blocks.append({
+                "type": "text",
+                "text": f"Summary of the earlier conversation:\n{summary}"
             })
-            
-            # Make API call
-            api_params = {
-                "model": "claude-3-5-sonnet-20241022",
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "messages": messages_for_api
-            }
-            
-            if system_message:
-                api_params["system"] = system_message
-            
-            response = self.client.messages.create(**api_params)
-            
-            claude_message = self.format_claude_response(response.content)
-            assistant_msg = {"role": "assistant", "content": claude_message}
-            self.full_history.append(assistant_msg)
-            
+        if system_blocks:
+            api_params["system"] = system_blocks
+        return {"params": api_params, "documents": documents}
+
+    def request_reply(self, user_node, base=None):
+        """Start streaming a reply to user_node using the session settings"""
+        try:
+            api_params = self.build_api_params(user_node, base)
         except Exception as e:
-            error_msg = {"role": "system", "content": f"Error: {str(e)}"}
-            self.full_history.append(error_msg)
+            self.append_message("system", f"Error: {str(e)}", parent=user_node)
+            return
+        self.start_reply(user_node, api_params, prepare=self.build_map_step(user_node))
+
+    def mapped_pdfs(self):
+        """PDFs read by map requests in map-reduce mode, not sent with the message"""
+        if not self.mapreduce_var.get():
+            return []
+        return [path for path in self.selected_pdfs if self.attachments.media_type(path) == "application/pdf"]
+
+    def inline_attachments(self):
+        """Attachments sent with the message itself, in order"""
+        mapped = self.mapped_pdfs()
+        return [path for path in self.selected_pdfs if path not in mapped]
+
+    def build_map_step(self, user_node, model=None):
+        """In map-reduce mode, the worker step that reads the documents for a reply.
+
+        Returns None when the documents go into the request as usual.
+        Otherwise returns prepare(reply_node, api_params): it gets notes on
+        every document group, reading the groups without cached notes in
+        parallel, and returns api_params with the notes in place of the
+        text of the last message. Images attached to it stay.
+        """
+        mapped = self.mapped_pdfs()
+        if not mapped:
+            return None
+        documents = [(path, self.attachments.get(path), self.attachments.pages(path)) for path in mapped]
+        self._doc_digests = {path: cached for path, cached in self._doc_digests.items()
+                             if path in self.selected_pdfs}
+        question = user_node.content
+        # Notes are written with the conversation in view, so "the second one" means something
+        history = [node.message for node in self.tree.path_to(user_node.parent)]
+        conversation = conversation_excerpt(history, question)
+        model = model or self.model_var.get()
+
+        def prepare(reply_node, api_params):
+            hashed = []
+            for path, data, pages in documents:
+                cached = self._doc_digests.get(path)
+                if cached is None or cached[0] is not data:
+                    cached = (data, document_digest(data))
+                    self._doc_digests[path] = cached
+                hashed.append((path, data, cached[1], pages))
+            groups = group_documents(hashed)
+            self._reply_notes[reply_node] = [(group.key, model) for group in groups]
+            notes = map_documents(
+                self.client, groups, conversation, model, self.doc_notes,
+                on_progress=lambda done, total: self.services.call_soon(
+                    self._show_map_progress, reply_node, done, total),
+                on_usage=lambda group, usage: self.services.call_soon(
+                    self._record_reply_usage, reply_node, make_entry("map", model, usage_to_dict(usage), {
+                        "history_messages": 0, "history_chars": 0, "summary": False,
+                        "attachments": [{"name": os.path.basename(path), "bytes": len(data)}
+                                        for path, data in zip(group.paths, group.data)]
+                    }))
+            )
+            # Images are still sent inline, with their cache breakpoint
+            last = api_params["messages"][-1]["content"]
+            images = [block for block in last if block["type"] != "text"] if isinstance(last, list) else []
+            messages = api_params["messages"][:-1] + [reduce_message(groups, notes, question, images)]
+            return dict(api_params, messages=messages)
+        return prepare
+
+    def _show_map_progress(self, reply_node, done, total):
+        # Shown in place of the reply until its text starts to arrive
+        if not self.closed and not reply_node.content:
+            self.chat_display.update_message(reply_node, f"Reading documents: {done}/{total} groups done...")
+
+    def start_reply(self, user_node, api_params, listener=None, prepare=None):
+        """Stream a reply to user_node on a worker thread.
+
+        The reply is added right away as an empty child of user_node and
+        filled in as text arrives, so it lands on the right branch even if
+        the user switches branches or tabs meanwhile. listener, if given,
+        gets on_text(text), on_finish(latency, usage) and on_error(error).
+        prepare, if given, runs first on the worker and returns the
+        api_params to send, see build_map_step.
+        """
+        reply_node = self.append_message("assistant", "", parent=user_node)
+        # What the request carried, for the usage ledger
+        request = describe_request(api_params, self.inline_attachments())
+        kind = "fanout" if listener else "reply"
+        self.pending_replies.add(reply_node)
+        if listener:
+            self.reply_listeners[reply_node] = listener
+        self.update_send_state()
+        # Fan-out streams get threads of their own: they all run at once, so
+        # the slowest decides the wait, and file loading is not held up meanwhile
+        self.services.submit(
+            self._stream_reply, reply_node, api_params, prepare,
+            on_done=lambda result: self._finish_reply(reply_node, api_params, kind, request, *result),
+            on_error=lambda e: self._fail_reply(reply_node, e),
+            dedicated=listener is not None
+        )
+        return reply_node
+
+    def _stream_reply(self, reply_node, api_params, prepare=None):
+        """Worker thread: stream the response, handing text over in batches"""
+        start = time.perf_counter()
+        first_token = None
+        if prepare:
+            api_params = prepare(reply_node, api_params)
+            if reply_node not in self.pending_replies:
+                return None, None
+        with self.client.messages.stream(**api_params) as stream:
+            for text in stream.text_stream:
+                if reply_node not in self.pending_replies:
+                    return None, None  # Abandoned by reset_session; leaving closes the stream
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                with self._stream_lock:
+                    # Only the first delta since the last flush schedules a UI update
+                    first = reply_node not in self._stream_buffers
+                    self._stream_buffers.setdefault(reply_node, []).append(text)
+                if first:
+                    self.services.call_soon(self._flush_stream, reply_node)
+            response = stream.get_final_message()
+        latency = {"first_token": first_token, "total": time.perf_counter() - start}
+        return response, latency
+
+    def _flush_stream(self, reply_node):
+        with self._stream_lock:
+            chunks = self._stream_buffers.pop(reply_node, None)
+        if not chunks or self.closed or reply_node not in self.pending_replies:
+            return
+        text = "".join(chunks)
+        reply_node.message["content"] += text
+        self.chat_display.update_message(reply_node, reply_node.content)
+        listener = self.reply_listeners.get(reply_node)
+        if listener:
+            listener.on_text(text)
+
+    def _finish_reply(self, reply_node, api_params, kind, request, response, latency):
+        if reply_node not in self.pending_replies:
+            return  # Belongs to a conversation reset_session replaced
+        self._flush_stream(reply_node)
+        self.pending_replies.discard(reply_node)
+        listener = self.reply_listeners.pop(reply_node, None)
+        if self.closed:
+            return
+        usage = usage_to_dict(getattr(response, 'usage', None))
+        reply_node.message["content"] = self.format_claude_response(response.content)
+        reply_node.meta = dict(
+            reply_node.meta or {},  # Keeps a pin set while the reply was streaming
+            model=api_params["model"],
+            temperature=api_params["temperature"],
+            latency=latency,
+            usage=usage
+        )
+        self.chat_display.update_message(reply_node, reply_node.content)
+        self.record_usage(make_entry(kind, api_params["model"], usage, request, latency))
+        notes_keys = self._reply_notes.pop(reply_node, None)
+        if notes_keys and notes_missing(reply_node.content):
+            # Stale for this conversation: read the documents again next time
+            self.doc_notes.discard(notes_keys)
+            self.append_message("system", "The document notes did not cover this question. "
+                                "Regenerate to have the documents read again with it in view.",
+                                parent=reply_node)
+        if listener:
+            listener.on_finish(latency, usage)
+        self.update_send_state()
+        self.refresh_display()
+
+    def _record_reply_usage(self, reply_node, entry):
+        # Usage of a reply's sub-requests, unless the reply was abandoned meanwhile
+        if reply_node in self.pending_replies:
+            self.record_usage(entry)
+
+    def record_usage(self, entry):
+        if self.closed:
+            return
+        self.ledger.append(entry)
+        self.update_usage_label()
+        self.autosaver.schedule()
+
+    def _on_summary_usage(self, model, usage):
+        # Summarizer thread: the ledger is only touched on the Tk thread
+        self.services.call_soon(self.record_usage, make_entry("summary", model, usage_to_dict(usage)))
+
+    def update_usage_label(self):
+        self.usage_label.configure(text=short_summary(self.ledger))
+
+    def _fail_reply(self, reply_node, error):
+        with self._stream_lock:
+            self._stream_buffers.pop(reply_node, None)
+        if reply_node not in self.pending_replies:
+            return  # Belongs to a conversation reset_session replaced
+        self.pending_replies.discard(reply_node)
+        self._reply_notes.pop(reply_node, None)
+        listener = self.reply_listeners.pop(reply_node, None)
+        if self.closed:
+            return
+        if listener:
+            listener.on_error(error)
+        user_node = reply_node.parent
+        # Keep partial text if some arrived, otherwise drop the empty reply
+        if reply_node.content:
+            self.append_message("system", f"Error: {str(error)}", parent=reply_node)
+        else:
+            self.tree.remove(reply_node)
+            self.append_message("system", f"Error: {str(error)}", parent=user_node)
+        self.update_send_state()
+        self.refresh_display()
+
+    def open_fanout(self):
+        """Open the window for sending one prompt to several models/settings"""
+        if self.fanout_window is not None and self.fanout_window.winfo_exists():
+            self.fanout_window.lift()
+            return
+        self.fanout_window = FanoutWindow(self.root, self.fanout_configs, self.run_fanout)
+
+    def run_fanout(self, configs_text):
+        """Send the chat input to every configuration at once.
+
+        Every reply becomes its own branch under the same prompt, so they
+        can be compared in the window and continued in the chat. The
+        requests run concurrently; the total wait is the slowest one.
+        """
+        window = self.fanout_window
+        if not self.client:
+            self.show_error("Cannot send message: No valid API key found. Please add your API key to api_key.txt")
+            return
+        prompt = self.message_input.get().strip()
+        if not prompt or self.pending_replies:
+            return
+        if self.loading_pdfs:
+            window.summary_label.configure(text=f"Please wait, {len(self.loading_pdfs)} file(s) still loading")
+            return
+        try:
+            configs = parse_configs(configs_text, float(self.temperature_var.get()), int(self.tokens_var.get()))
+        except ValueError as e:
+            window.summary_label.configure(text=f"Error: {e}")
+            return
+        self.fanout_configs = configs_text
+        self.message_input.delete()
         
+        user_node = self.append_message("user", prompt)
+        try:
+            # Same context, system message and documents for every configuration
+            base_params = self.build_api_params(user_node)
+        except Exception as e:
+            self.show_error(f"Error: {str(e)}")
+            return
+        window.start(prompt, configs)
+        reply_nodes = []
+        for i, config in enumerate(configs):
+            api_params = dict(base_params, model=config.model,
+                              temperature=config.temperature, max_tokens=config.max_tokens)
+            reply_nodes.append(self.start_reply(user_node, api_params, FanoutListener(window, i),
+                                                prepare=self.build_map_step(user_node, config.model)))
+        # Show the first configuration's reply in the chat, the rest are sibling branches
+        self.tree.select(reply_nodes[0])
         self.refresh_display()
 
+    def update_send_state(self):
+        """Disable sending while a reply in this session is still streaming"""
+        if self.pending_replies:
+            self.send_button.state(['disabled'])
+        else:
+            self.send_button.state(['!disabled'])
+
     def select_pdf(self):
-        """Handle PDF file selection"""
+        """Handle PDF/image selection; files are read and checked on worker threads"""
+        images = " ".join(f"*{ext}" for ext in IMAGE_EXTENSIONS)
         file_paths = filedialog.askopenfilenames(
-            filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
+            filetypes=[("PDFs and images", f"*.pdf {images}"), ("PDF files", "*.pdf"),
+                       ("Images", images), ("All files", "*.*")]
         )
+        loading = {job.path for job in self.loading_pdfs}
         for file_path in file_paths:
-            if file_path and file_path not in self.selected_pdfs:
-                try:
-                    with open(file_path, 'rb') as f:
-                        pdf_data = f.read()
-                        filename = os.path.basename(file_path)
-                        self.pdf_files[file_path] = base64.b64encode(pdf_data).decode('utf-8')
-                        self.selected_pdfs.append(file_path)
-                        self.pdf_listbox.insert(tk.END, filename)
-                except Exception as e:
-                    self.full_history.append({
-                        "role": "system", 
-                        "content": f"Error loading PDF {filename}: {str(e)}"
-                    })
-                    self.refresh_display()
+            if not file_path or file_path in self.selected_pdfs or file_path in loading:
+                continue
+            # Another tab already loaded this file, share its data
+            if self.attachments.retain(file_path):
+                self.selected_pdfs.append(file_path)
+                continue
+            job = IngestJob(file_path)
+            self.loading_pdfs.append(job)
+            # Images are shrunk and re-encoded, PDFs are sent as they are
+            self.services.submit(
+                ingest_image if is_image(file_path) else ingest_pdf, job, self._report_pdf_progress,
+                on_done=lambda data, job=job: self._finish_pdf(job, data),
+                on_error=lambda e, job=job: self._fail_pdf(job, e)
+            )
+        self.refresh_pdf_list()
+        self.autosaver.schedule()
+
+    def _report_pdf_progress(self, job):
+        # Worker thread: the list is redrawn on the Tk thread
+        self.services.call_soon(self.refresh_pdf_list)
+
+    def _finish_pdf(self, job, data):
+        if job in self.loading_pdfs:
+            self.loading_pdfs.remove(job)
+        if job.cancelled or self.closed or data is None:
+            return
+        self.attachments.add(job.path, data, job.media_type, job.pages)
+        self.selected_pdfs.append(job.path)
+        self.refresh_pdf_list()
+        self.autosaver.schedule()
+
+    def _fail_pdf(self, job, error):
+        if job in self.loading_pdfs:
+            self.loading_pdfs.remove(job)
+        if job.cancelled or self.closed:
+            return
+        self.refresh_pdf_list()
+        self.show_error(f"Error loading {job.name}: {str(error)}")
+
+    def refresh_pdf_list(self):
+        """Show the selected PDFs, then the ones still loading with their progress"""
+        if self.closed:
+            return
+        rows = [os.path.basename(path) for path in self.selected_pdfs]
+        rows.extend(f"{job.name} (loading {job.progress:.0%})" for job in self.loading_pdfs)
+        self.pdf_listbox.delete(0, tk.END)
+        if rows:
+            self.pdf_listbox.insert(tk.END, *rows)
+
+    def add_attachment(self, file_path, data, media_type="application/pdf", pages=None):
+        """Select a file for this session, storing its data in the shared store"""
+        self.attachments.add(file_path, data, media_type, pages)
+        self.selected_pdfs.append(file_path)
+        self.refresh_pdf_list()
+        self.autosaver.schedule()
 
     def clear_all_pdfs(self):
-        """Clear all PDF selections"""
-        self.pdf_files.clear()
+        """Clear all PDF selections, stopping any still loading"""
+        for pdf_path in self.selected_pdfs:
+            self.attachments.release(pdf_path)
         self.selected_pdfs.clear()
+        for job in self.loading_pdfs:
+            job.cancelled = True
+        self.loading_pdfs.clear()
         self.pdf_listbox.delete(0, tk.END)
+        self.autosaver.schedule()
 
     def remove_selected_pdf(self, event):
         """Remove a single PDF from the list on right-click"""
         selection = self.pdf_listbox.curselection()
         if selection:
             index = selection[0]
-            file_path = self.selected_pdfs[index]
-            del self.pdf_files[file_path]
-            self.selected_pdfs.pop(index)
-            self.pdf_listbox.delete(index)
+            if index < len(self.selected_pdfs):
+                file_path = self.selected_pdfs.pop(index)
+                self.attachments.release(file_path)
+            else:
+                job = self.loading_pdfs.pop(index - len(self.selected_pdfs))
+                job.cancelled = True
+            self.refresh_pdf_list()
+            self.autosaver.schedule()
     
     def format_claude_response(self, response):
         if isinstance(response, str):
@@ -481,30 +1114,46 @@ class ClaudeChatApp:
         return str(response)
     
     def refresh_display(self):
-        """Refresh the chat display with current messages and context indicators"""
-        # If this is the first refresh, populate the display
-        if len(self.chat_display.messages) == 0:
-            total_messages = len(self.full_history)
-            context_size = self.context_size  # Get current context size
-            
-            for i, msg in enumerate(self.full_history):
-                # Calculate if message should be in context
-                # Last context_size messages should be in context
-                in_context = i >= (total_messages - context_size)
-                self.chat_display.add_message(msg, msg["role"])
-                
-            # Force a refresh of context indicators
-            self.chat_display.refresh_context_indicators()
-            
-        # Otherwise, just add any new messages
-        elif len(self.full_history) > len(self.chat_display.messages):
-            # Get the new messages
-            new_messages = self.full_history[len(self.chat_display.messages):]
-            for msg in new_messages:
-                self.chat_display.add_message(msg, msg["role"])
+        """Sync the chat display with the active branch and its context indicators"""
+        path = self.tree.path()
+        shown = self.chat_display.messages
+        
+        # Keep the widgets that still match the branch, rebuild from the first difference
+        keep = 0
+        while (keep < len(shown) and keep < len(path)
+               and shown[keep].key is path[keep]
+               and shown[keep].branch == self.tree.branch_info(path[keep])):
+            keep += 1
+        if keep < len(shown):
+            self.chat_display.truncate(keep)
+        
+        new_nodes = path[keep:]
+        if len(new_nodes) == 1:
+            node = new_nodes[0]
+            self.chat_display.add_message(
+                node.message,
+                node.role,
+                branch=self.tree.branch_info(node),
+                key=node,
+                pinned=self.tree.is_pinned(node)
+            )
+        else:
+            # Loaded chats and branch switches: build in chunks, newest first
+            self.chat_display.add_messages([
+                (node.message, node.role, self.tree.branch_info(node), node, self.tree.is_pinned(node))
+                for node in new_nodes
+            ])
             
-            # Refresh context indicators to ensure proper display
-            self.chat_display.refresh_context_indicators()
+        # Refresh context indicators to ensure proper display
+        self.chat_display.refresh_context_indicators()
+        self.update_summary()
+        self.autosaver.schedule()
+
+    def update_summary(self):
+        """Queue messages that left the context window for summarizing"""
+        if self.summarizing:
+            path = self.tree.path()
+            self.summarizer.schedule(path, len(path) - self.context_size)
 
     def reset_new_chat_button(self):
         """Reset the new chat button to its default state"""
@@ -525,18 +1174,43 @@ class ClaudeChatApp:
                 
         else:
             self.confirm_new_chat = False
-            self.full_history = []
-            self.api_context = []
-            self.root.title("Claude Chat Interface")
-            self.system_input.delete("1.0", tk.END)
-            self.temperature_var.set("1.0")
-            self.tokens_var.set("1024")
-            self.context_size_var.set("10")
-            self.context_size = 10
-            # Reset PDF selections
-            self.pdf_files.clear()
-            self.selected_pdfs.clear()
-            self.pdf_listbox.delete(0, tk.END)
-            self.chat_display.clear()
+            self.reset_session()
             self.reset_new_chat_button()
-            self.refresh_display()
\ No newline at end of file
+            self.refresh_display()
+
+    def abandon_replies(self):
+        """Stop waiting for the replies still streaming; their workers stop at the next chunk"""
+        for listener in self.reply_listeners.values():
+            listener.on_error(Exception("Cancelled, the conversation was replaced"))
+        self.reply_listeners.clear()
+        self.pending_replies.clear()
+        self._reply_notes.clear()
+        with self._stream_lock:
+            self._stream_buffers.clear()
+        self._prebuilt = None
+        self.update_send_state()
+
+    def reset_session(self):
+        """Clear the conversation, settings and attachments"""
+        self.abandon_replies()
+        self.tree = ConversationTree()
+        if self.summarizer:
+            self.summarizer.clear()
+        self.api_context = []
+        self.set_title(DEFAULT_TITLE)
+        self.system_input.delete("1.0", tk.END)
+        self.model_var.set(DEFAULT_MODEL)
+        self.temperature_var.set("1.0")
+        self.tokens_var.set("1024")
+        self.context_size_var.set("10")
+        self.context_size = 10
+        self.summarize_var.set(False)
+        self.policy_var.set(POLICIES[DEFAULT_POLICY])
+        self.update_policy_state()
+        self.mapreduce_var.set(False)
+        self.doc_notes.clear()
+        self.ledger = []
+        self.update_usage_label()
+        # Reset PDF selections
+        self.clear_all_pdfs()
+        self.chat_display.clear()
\ No newline at end of file
@@ -2,16 +2,44 @@ import tkinter as tk
 from tkinter import ttk
 from editable_message import EditableMessage
 
+HYDRATE_CHUNK = 15  # Message widgets built per step when showing many at once
+
+
+class PendingMessage:
+    """Stands in for a message widget that add_messages has not built yet"""
+
+    def __init__(self, message, role, branch, key, pinned=False):
+        self.content = message["content"]
+        self.role = role
+        self.branch = branch
+        self.key = key
+        self.in_context = True
+        self.pinned = pinned
+
+    def set_content(self, content):
+        self.content = content
+
+    def update_context_status(self, in_context):
+        self.in_context = in_context
+
+    def set_pinned(self, pinned):
+        self.pinned = pinned
+
+    def destroy(self):
+        pass
+
 class ContextScrollCanvas(tk.Canvas):
-    def __init__(self, parent, messages, get_context_size, width=12):
+    def __init__(self, parent, messages, get_context_size, width=12, get_context_flags=None):
         super().__init__(parent, width=width, highlightthickness=0)
         self.messages = messages
         self.get_context_size = get_context_size
+        self.get_context_flags = get_context_flags
         self._width = width
         # Softer colors for better visual comfort
         self.thumb_color = 'gray75'
         self.out_of_context_color = '#a3434d'  # Lighter, more pastel red
         self.in_context_color = 'gray85'
+        self.pinned_color = '#d4a017'
         self.bind('<Configure>', self._on_configure)
         
     def set(self, start, end):
@@ -37,8 +65,20 @@ class ContextScrollCanvas(tk.Canvas):
         # Calculate the visual offset to align context boundary with content
         offset_factor = visible_portion * 0.8  # Adjust this factor to fine-tune alignment
         
-        # Draw context indicators with adjusted positioning
         msg_height = height / total_messages if total_messages > 0 else height
+        flags = self.get_context_flags() if self.get_context_flags else None
+        if flags is not None and len(flags) == total_messages:
+            # Per message: pinned, in or out of the request
+            for i, flag in enumerate(flags):
+                if self.messages[i].pinned:
+                    color = self.pinned_color
+                else:
+                    color = self.in_context_color if flag else self.out_of_context_color
+                self.create_rectangle(0, i * msg_height, self._width, (i + 1) * msg_height, fill=color, width=0)
+            self._draw_thumb(height, start, visible_portion)
+            return
+        
+        # Draw context indicators with adjusted positioning
         for i in range(total_messages):
             y1 = i * msg_height
             y2 = (i + 1) * msg_height
@@ -48,7 +88,9 @@ class ContextScrollCanvas(tk.Canvas):
             color = self.out_of_context_color if adjusted_i < context_start else self.in_context_color
             self.create_rectangle(0, y1, self._width, y2, fill=color, width=0)
             
-        # Draw scrollbar thumb
+        self._draw_thumb(height, start, visible_portion)
+        
+    def _draw_thumb(self, height, start, visible_portion):
         thumb_height = max(20, height * visible_portion)
         thumb_top = height * float(start)
         self.create_rectangle(0, thumb_top, self._width, thumb_top + thumb_height,
@@ -58,15 +100,24 @@ class ContextScrollCanvas(tk.Canvas):
         self._width = event.width
 
 class EditableChatDisplay(ttk.Frame):
-    def __init__(self, parent, get_context_size, on_message_edit=None):
+    def __init__(self, parent, get_context_size, on_message_edit=None,
+                 on_switch_branch=None, on_regenerate=None, on_toggle_pin=None,
+                 get_context_flags=None, can_edit=None):
         super().__init__(parent)
         self.on_message_edit = on_message_edit
+        self.on_switch_branch = on_switch_branch
+        self.on_regenerate = on_regenerate
+        self.on_toggle_pin = on_toggle_pin
+        self.can_edit = can_edit  # can_edit(key), False for messages that cannot be edited now
         self.get_context_size = get_context_size
-        self.messages = []
+        self.get_context_flags = get_context_flags  # One bool per message, or None for "last N"
+        self.messages = []  # EditableMessage widgets, or PendingMessage while hydrating
+        self._hydrate_after = None
         
         # Create scrollable area
         self.canvas = tk.Canvas(self)
-        self.scrollbar_canvas = ContextScrollCanvas(self, self.messages, self.get_context_size)
+        self.scrollbar_canvas = ContextScrollCanvas(self, self.messages, self.get_context_size,
+                                                    get_context_flags=get_context_flags)
         self.scrollable_frame = ttk.Frame(self.canvas)
         
         # Configure scrolling behavior
@@ -101,7 +152,8 @@ class EditableChatDisplay(ttk.Frame):
     def _on_scroll(self, *args):
         """Handle scroll events"""
         self.canvas.yview(*('moveto', args[0]))
-        self.scrollbar_canvas.set(*args)
+        if self._hydrate_after is None:  # Drawn once when hydration finishes
+            self.scrollbar_canvas.set(*args)
         
     def _on_scrollbar_click(self, event):
         """Handle clicking on the scrollbar"""
@@ -126,40 +178,148 @@ class EditableChatDisplay(ttk.Frame):
         self.canvas.itemconfig(self.canvas_frame, width=event.width)
         
     def bind_mouse_wheel(self):
-        def _on_mousewheel(event):
-            self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
-        self.canvas.bind_all("<MouseWheel>", _on_mousewheel)
+        # One shared handler, several displays can exist (one per tab)
+        self.canvas.bind_all("<MouseWheel>", EditableChatDisplay._on_mousewheel)
         
-    def add_message(self, message, role):
+    @staticmethod
+    def _on_mousewheel(event):
+        """Scroll whichever chat display is under the pointer"""
+        try:
+            widget = event.widget.winfo_containing(event.x_root, event.y_root)
+        except (AttributeError, KeyError, tk.TclError):
+            return
+        while widget is not None and not isinstance(widget, EditableChatDisplay):
+            widget = widget.master
+        if widget is not None:
+            widget.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
+        
+    def add_message(self, message, role, branch=None, key=None, pinned=False):
         """Add a new message to the display"""
-        total_messages = len(self.messages)
-        context_size = self.get_context_size()
-        in_context = total_messages >= (len(self.messages) - context_size)
+        msg_widget = self._build_message(len(self.messages), message["content"], role, branch, key, pinned=pinned)
+        msg_widget.pack(fill=tk.X, padx=5, pady=2)
+        self.messages.append(msg_widget)
+        self.canvas.update_idletasks()
+        self.canvas.yview_moveto(1.0)
+        self.scrollbar_canvas.set(*self.canvas.yview())
         
+    def add_messages(self, items):
+        """Add many (message, role, branch, key, pinned) items, building widgets in chunks.
+
+        The newest chunk is built right away so the end of the conversation
+        can be read and used immediately; older ones follow in later after()
+        steps, each laid out once. Until then they are PendingMessages.
+        """
+        if not items:
+            return
+        for message, role, branch, key, pinned in items:
+            self.messages.append(PendingMessage(message, role, branch, key, pinned))
+        self._hydrate_cursor = len(self.messages) - 1
+        self._follow_bottom = True
+        self._hydrate_step()
+        
+    def _hydrate_step(self):
+        """Build the next chunk of pending messages, newest first"""
+        if self._hydrate_after is not None:
+            self.after_cancel(self._hydrate_after)
+            self._hydrate_after = None
+        built = 0
+        i = min(self._hydrate_cursor, len(self.messages) - 1)
+        while i >= 0 and built < HYDRATE_CHUNK:
+            pending = self.messages[i]
+            if isinstance(pending, PendingMessage):
+                msg_widget = self._build_message(i, pending.content, pending.role, pending.branch,
+                                                 pending.key, in_context=pending.in_context,
+                                                 pinned=pending.pinned)
+                # Everything after a pending message is built already
+                if i + 1 < len(self.messages):
+                    msg_widget.pack(fill=tk.X, padx=5, pady=2, before=self.messages[i + 1])
+                else:
+                    msg_widget.pack(fill=tk.X, padx=5, pady=2)
+                self.messages[i] = msg_widget
+                built += 1
+            i -= 1
+        self._hydrate_cursor = i
+        
+        if self._follow_bottom:
+            # One layout for the whole chunk, then stay at the newest message
+            self.canvas.update_idletasks()
+            self.canvas.yview_moveto(1.0)
+            self._follow_bottom = self.canvas.yview()[1] >= 0.999
+        if i >= 0:
+            self._hydrate_after = self.after(1, self._hydrate_step)
+        else:
+            self.refresh_context_indicators()
+            
+    def cancel_hydration(self):
+        if self._hydrate_after is not None:
+            self.after_cancel(self._hydrate_after)
+            self._hydrate_after = None
+            
+    def destroy(self):
+        self.cancel_hydration()
+        super().destroy()
+            
+    def _build_message(self, index, content, role, branch, key, in_context=True, pinned=False):
+        # index is captured now, the callbacks run much later
         msg_widget = EditableMessage(
             self.scrollable_frame,
-            message["content"],
+            content,
             role,
             in_context=in_context,
-            on_edit=lambda content: self._handle_edit(len(self.messages), content)
+            on_edit=lambda content: self._handle_edit(index, content),
+            branch=branch,
+            on_switch_branch=(lambda delta: self.on_switch_branch(index, delta))
+                             if self.on_switch_branch else None,
+            on_regenerate=(lambda: self.on_regenerate(index))
+                          if self.on_regenerate else None,
+            pinned=pinned,
+            on_toggle_pin=(lambda: self.on_toggle_pin(index))
+                          if self.on_toggle_pin else None,
+            can_edit=(lambda: self.can_edit(key)) if self.can_edit else None
         )
-        msg_widget.pack(fill=tk.X, padx=5, pady=2)
-        self.messages.append(msg_widget)
-        self.canvas.update_idletasks()
-        self.canvas.yview_moveto(1.0)
-        self.scrollbar_canvas.set(*self.canvas.yview())
+        msg_widget.key = key  # Lets the owner match widgets to its own records
+        return msg_widget
         
     def refresh_context_indicators(self):
         """Refresh which messages show context indicators"""
         total_messages = len(self.messages)
         context_size = self.get_context_size()
+        flags = self.get_context_flags() if self.get_context_flags else None
+        if flags is not None and len(flags) != total_messages:
+            flags = None  # Out of sync while the owner rebuilds, fall back to "last N"
         
         for i, msg_widget in enumerate(self.messages):
-            in_context = i >= (total_messages - context_size)
+            in_context = flags[i] if flags is not None else i >= (total_messages - context_size)
             if msg_widget.in_context != in_context:
                 msg_widget.update_context_status(in_context)
                 
-        # Update scrollbar indicators
+        # Update scrollbar indicators, unless hydration will do it when it finishes
+        if self._hydrate_after is None:
+            self.scrollbar_canvas.set(*self.canvas.yview())
+                
+    def update_message(self, key, content):
+        """Replace the text of the message added with key, if it is shown"""
+        for msg_widget in reversed(self.messages):
+            if msg_widget.key is key:
+                if isinstance(msg_widget, PendingMessage):
+                    msg_widget.set_content(content)
+                    return
+                at_bottom = self.canvas.yview()[1] >= 0.999
+                msg_widget.set_content(content)
+                self.canvas.update_idletasks()
+                if at_bottom:
+                    # Follow the text as it grows unless the user scrolled away
+                    self.canvas.yview_moveto(1.0)
+                self.scrollbar_canvas.set(*self.canvas.yview())
+                return
+                
+    def truncate(self, index):
+        """Remove the messages from index onward"""
+        for msg_widget in self.messages[index:]:
+            msg_widget.destroy()
+        del self.messages[index:]  # In place, the scrollbar shares this list
+        if not any(isinstance(msg_widget, PendingMessage) for msg_widget in self.messages):
+            self.cancel_hydration()
         self.scrollbar_canvas.set(*self.canvas.yview())
                 
     def _handle_edit(self, index, new_content):
@@ -169,8 +329,11 @@ class EditableChatDisplay(ttk.Frame):
             
     def clear(self):
         """Clear all messages"""
+        self.cancel_hydration()
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
-        self.messages = []
+        # Clear in place: the scrollbar canvas shares this list, rebinding it
+        # left the scrollbar holding (and drawing) every destroyed message
+        self.messages.clear()
         self.canvas.yview_moveto(0.0)
         self.scrollbar_canvas.set(0, 1)
\ No newline at end of file
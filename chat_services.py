@@ -0,0 +1,167 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import anthropic # type: ignore
+from autosave import BackgroundWriter
+
+API_KEY_FILE = 'api_key.txt'
+POLL_INTERVAL_MS = 30  # How often worker results are handed to the Tk thread
+WARM_UP_INTERVAL = 4.0  # Seconds; idle pooled connections are closed after 5
+
+
+def load_api_key():
+    """Load API key from file or create the file if it doesn't exist."""
+    try:
+        # Try to read the API key
+        with open(API_KEY_FILE, 'r') as f:
+            api_key = f.read().strip()
+        return api_key or None
+    except FileNotFoundError:
+        # Create the file if it doesn't exist
+        with open(API_KEY_FILE, 'w') as f:
+            pass  # Create empty file
+        return None
+
+
+def create_client():
+    """Create the API client, or None when no key is configured"""
+    api_key = load_api_key()
+    return anthropic.Anthropic(api_key=api_key) if api_key else None
+
+
+class AttachmentStore:
+    """Base64 attachment data shared by all sessions, kept once per file"""
+
+    def __init__(self):
+        self._data = {}  # {path: base64 data}
+        self._media_types = {}  # {path: media type}, for anything but PDFs
+        self._pages = {}  # {path: page count}, for PDFs whose count is known
+        self._refs = {}  # {path: number of sessions using it}
+        self._lock = threading.Lock()
+
+    def add(self, path, data, media_type="application/pdf", pages=None):
+        with self._lock:
+            self._data[path] = data
+            if media_type != "application/pdf":
+                self._media_types[path] = media_type
+            if pages:
+                self._pages[path] = pages
+            self._refs[path] = self._refs.get(path, 0) + 1
+
+    def retain(self, path):
+        """Register another user of data that is already stored"""
+        with self._lock:
+            if path not in self._data:
+                return False
+            self._refs[path] += 1
+            return True
+
+    def release(self, path):
+        with self._lock:
+            count = self._refs.get(path, 0) - 1
+            if count > 0:
+                self._refs[path] = count
+            else:
+                self._refs.pop(path, None)
+                self._data.pop(path, None)
+                self._media_types.pop(path, None)
+                self._pages.pop(path, None)
+
+    def get(self, path):
+        return self._data.get(path)
+
+    def media_type(self, path):
+        return self._media_types.get(path, "application/pdf")
+
+    def pages(self, path):
+        """Page count of a PDF, 0 when unknown or not a PDF"""
+        return self._pages.get(path, 0)
+
+    def sizes(self):
+        """{path: length of its base64 data}"""
+        with self._lock:
+            return {path: len(data) for path, data in self._data.items()}
+
+    def __contains__(self, path):
+        return path in self._data
+
+
+class ChatServices:
+    """Resources shared by every chat session in the window.
+
+    One API client (and with it one HTTP connection pool), one attachment
+    store, one pool of worker threads and one thread for file writes. Work
+    submitted here runs off the Tk thread; its callbacks are queued and run
+    back on the Tk thread.
+    """
+
+    def __init__(self, root, client, max_workers=8):
+        self.root = root
+        self.client = client
+        self.attachments = AttachmentStore()
+        self.writer = BackgroundWriter()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat-worker")
+        self._callbacks = queue.Queue()
+        self._last_warm_up = 0.0
+        self._poll()
+
+    def submit(self, func, *args, on_done=None, on_error=None, dedicated=False):
+        """Run func(*args) on a worker, then on_done(result) or on_error(exc) on the Tk thread.
+
+        dedicated runs it on a thread of its own instead of the shared pool,
+        for work that has to start right away however busy the pool is.
+        """
+        def run():
+            try:
+                result = func(*args)
+            except Exception as e:
+                if on_error:
+                    self.call_soon(on_error, e)
+            else:
+                if on_done:
+                    self.call_soon(on_done, result)
+        if dedicated:
+            thread = threading.Thread(target=run, name="chat-dedicated", daemon=True)
+            thread.start()
+            return thread
+        return self.executor.submit(run)
+
+    def warm_up(self):
+        """Open (or keep open) a pooled connection to the API in the background.
+
+        Makes a cheap models.list call so the TCP and TLS handshakes are done
+        before the next message is sent. Throttled to once per interval.
+        """
+        now = time.monotonic()
+        if not self.client or now - self._last_warm_up < WARM_UP_INTERVAL:
+            return
+        self._last_warm_up = now
+        self.executor.submit(self._warm_up)
+
+    def _warm_up(self):
+        try:
+            self.client.models.list(limit=1)
+        except Exception as e:
+            print(f"Connection warm-up failed: {e}")
+
+    def call_soon(self, callback, *args):
+        """Schedule callback(*args) on the Tk thread, safe to call from any thread"""
+        self._callbacks.put((callback, args))
+
+    def _poll(self):
+        while True:
+            try:
+                callback, args = self._callbacks.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in background callback: {e}")
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def shutdown(self, write_timeout=10):
+        """Stop the workers, giving pending file writes a chance to finish"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.writer.flush(timeout=write_timeout)
@@ -0,0 +1,135 @@
+import os
+import tkinter as tk
+from tkinter import ttk, messagebox
+from chat_app import ClaudeChatApp, DEFAULT_TITLE
+from chat_services import ChatServices, create_client
+from autosave import adopt_autosave, find_autosaves, prune_blobs, release_orphans
+from diagnostics import DiagnosticsPanel
+
+class ChatTabs:
+    """Main window holding several independent chat sessions in tabs.
+
+    All tabs share one ChatServices, so there is a single API client and
+    connection pool, one attachment store and one set of worker threads.
+    """
+    def __init__(self, root, client=None, diagnostics=False):
+        self.root = root
+        self.root.title(DEFAULT_TITLE)
+        self.root.geometry("750x830")
+
+        # A stand-in (record/replay) client can be passed in, otherwise use the real API
+        self.services = ChatServices(root, client if client is not None else create_client())
+        self.sessions = []
+        self.tab_count = 0
+        self.diagnostics_panel = None
+
+        # Tab controls
+        toolbar = ttk.Frame(self.root)
+        toolbar.pack(padx=10, pady=(5, 0), fill=tk.X)
+        ttk.Button(toolbar, text="New Tab", command=self.new_tab).pack(side=tk.LEFT)
+        ttk.Button(toolbar, text="Close Tab", command=self.close_tab).pack(side=tk.LEFT, padx=5)
+
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+
+        self.root.bind_all("<Control-t>", lambda e: self.new_tab())
+        self.root.bind_all("<Control-w>", lambda e: self.close_tab())
+        self.root.bind_all("<Control-D>", lambda e: self.toggle_diagnostics())  # Ctrl+Shift+D
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        if not self.restore_sessions():
+            self.new_tab()
+        if diagnostics:
+            self.toggle_diagnostics()
+
+    def restore_sessions(self):
+        """Offer to reopen the sessions autosaved by runs that have ended.
+
+        Sessions of other instances still running are left alone.
+        """
+        autosaves = find_autosaves()
+        if autosaves and messagebox.askyesno(
+            "Restore Session",
+            f"Restore {len(autosaves)} chat session(s) from last time?",
+            parent=self.root
+        ):
+            for path in autosaves:
+                # Moved into this run's directory, so no other instance offers it again
+                try:
+                    path = adopt_autosave(path)
+                except OSError as e:
+                    print(f"Could not restore {path}: {e}")
+                    continue
+                session = self.new_tab(autosave_path=path)
+                session.restore_autosave(path)
+        else:
+            for path in autosaves:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        release_orphans()
+        prune_blobs()
+        return bool(self.sessions)
+
+    def new_tab(self, autosave_path=None):
+        """Open a new empty chat session"""
+        self.tab_count += 1
+        frame = ttk.Frame(self.notebook)
+        frame.tab_name = f"Chat {self.tab_count}"
+        self.notebook.add(frame, text=frame.tab_name)
+        session = ClaudeChatApp(
+            self.root,
+            services=self.services,
+            container=frame,
+            on_title=self._on_session_title,
+            autosave_path=autosave_path
+        )
+        self.sessions.append(session)
+        self.notebook.select(frame)
+        return session
+
+    def current_session(self):
+        if not self.sessions:
+            return None
+        return self.sessions[self.notebook.index(self.notebook.select())]
+
+    def close_tab(self):
+        """Close the current tab, the last one stays open"""
+        session = self.current_session()
+        if session is None or len(self.sessions) == 1:
+            return
+        session.close()
+        self.sessions.remove(session)
+        self.notebook.forget(session.container)
+        session.container.destroy()
+
+    def toggle_diagnostics(self):
+        """Show or hide the memory diagnostics panel"""
+        if self.diagnostics_panel is not None and self.diagnostics_panel.winfo_exists():
+            self.diagnostics_panel.close()
+            self.diagnostics_panel = None
+        else:
+            self.diagnostics_panel = DiagnosticsPanel(self.root, self.services, lambda: list(self.sessions))
+
+    def _on_session_title(self, session, title):
+        # Loaded chats show their file name on the tab
+        if "Loaded: " in title:
+            self.notebook.tab(session.container, text=title.split("Loaded: ", 1)[1])
+        else:
+            self.notebook.tab(session.container, text=session.container.tab_name)
+        if self.notebook.select() == str(session.container):
+            self.root.title(title)
+
+    def _on_tab_changed(self, event=None):
+        session = self.current_session()
+        if session is not None:
+            self.root.title(session.title)
+
+    def on_close(self):
+        # Keep the autosaves so the next start can offer to restore them
+        for session in self.sessions:
+            session.close(keep_autosave=True)
+        self.services.shutdown()
+        self.root.destroy()
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+
+# Policy id: label shown in the settings
+POLICIES = OrderedDict([
+    ("newest", "Pinned + newest"),
+    ("replies-first", "Drop old replies first"),
+])
+DEFAULT_POLICY = "newest"
+PROTECTED_TAIL = 2  # Newest messages never evicted by replies-first, i.e. the last exchange
+
+
+def context_flags(roles, pinned, context_size, policy=DEFAULT_POLICY):
+    """Which messages go into the request, as one bool per message.
+
+    Pinned messages are always in and do not count towards context_size.
+    Of the rest, "newest" keeps the last context_size messages; "replies-first"
+    keeps context_size messages too, but evicts the oldest assistant replies
+    before any user message, so questions and specs outlive the answers.
+    """
+    flags = list(pinned)
+    candidates = [i for i in range(len(roles)) if not pinned[i]]
+    if context_size <= 0:
+        return flags
+    if policy == "replies-first" and len(candidates) > context_size:
+        # The protected tail cannot be larger than the window itself
+        evictable = candidates[:-min(PROTECTED_TAIL, context_size)]
+        order = ([i for i in evictable if roles[i] == "assistant"] +
+                 [i for i in evictable if roles[i] != "assistant"])
+        evicted = set(order[:len(candidates) - context_size])
+        keep = [i for i in candidates if i not in evicted]
+    else:
+        keep = candidates[-context_size:]
+    for i in keep:
+        flags[i] = True
+    return flags
+
+
+def split_pinned(flags, pinned):
+    """Split the included messages into (pinned before the window, window).
+
+    The window starts at the oldest included message that is not pinned;
+    pinned messages older than that are sent apart from the conversation,
+    where they stay stable for prompt caching as the window moves on.
+    Both are lists of indices.
+    """
+    start = next((i for i, flag in enumerate(flags) if flag and not pinned[i]), len(flags))
+    early = [i for i in range(start) if pinned[i]]
+    window = [i for i in range(start, len(flags)) if flags[i]]
+    return early, window
+
+
+def pinned_block(messages):
+    """System prompt block quoting pinned messages that left the window"""
+    parts = [f"[{msg['role']}]\n{msg['content']}" for msg in messages]
+    return {
+        "type": "text",
+        "text": "Pinned messages from earlier in the conversation, kept for reference:\n\n" + "\n\n".join(parts),
+        "cache_control": {"type": "ephemeral"}
+    }
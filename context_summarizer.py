@@ -0,0 +1,122 @@
+import threading
+
+SUMMARY_MODEL = "claude-3-5-haiku-20241022"
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant. Merge the new messages into the current summary. Keep facts, "
+    "decisions, names, numbers and open questions; drop pleasantries. Reply "
+    "with the updated summary only."
+)
+
+
+class RollingSummarizer:
+    """Folds messages that left the context window into a running summary.
+
+    Summaries are stored per conversation node: the summary at a node covers
+    every message from the start of its branch up to and including it. Moving
+    the window forward only sends the previous summary plus the newly evicted
+    messages, and branches reuse the summaries of their shared prefix.
+    """
+
+    def __init__(self, client, model=SUMMARY_MODEL, max_tokens=1024, batch_size=20, on_usage=None):
+        self.client = client
+        self.on_usage = on_usage  # Called as on_usage(model, response.usage) from the worker thread
+        self.model = model
+        self.max_tokens = max_tokens
+        self.batch_size = batch_size  # Most messages folded in by a single call
+        self.summaries = {}  # {node: summary text}
+        self.version = 0  # Bumped whenever a summary is added or cleared
+        self._lock = threading.Lock()
+        self._pending = None  # Latest (branch, boundary) asked for, older ones are dropped
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+    def clear(self):
+        with self._lock:
+            self.summaries.clear()
+            self.version += 1
+            self._pending = None
+
+    def summary_for(self, branch, boundary):
+        """Return (summary, covered) for the first boundary nodes of branch.
+
+        covered is how many of those nodes the summary includes; anything
+        between covered and boundary has not been folded in yet.
+        """
+        with self._lock:
+            for i in range(min(boundary, len(branch)) - 1, -1, -1):
+                summary = self.summaries.get(branch[i])
+                if summary is not None:
+                    return summary, i + 1
+        return "", 0
+
+    def stop(self):
+        """End the worker thread; a fold in progress stops after its current call"""
+        self._stopped = True
+        self.on_usage = None  # The callback holds on to the owning session
+        with self._lock:
+            self._pending = None
+        self._wakeup.set()
+
+    def schedule(self, branch, boundary):
+        """Fold branch[:boundary] into the summary in the background"""
+        if boundary <= 0 or self._stopped:
+            return
+        if self.summary_for(branch, boundary)[1] >= boundary:
+            return
+        with self._lock:
+            self._pending = (list(branch[:boundary]), boundary)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                job, self._pending = self._pending, None
+            if job is None:
+                continue
+            try:
+                self._fold(*job)
+            except Exception as e:
+                print(f"Could not update conversation summary: {e}")
+
+    def _fold(self, branch, boundary):
+        summary, covered = self.summary_for(branch, boundary)
+        while covered < boundary:
+            # Stop early if a newer request replaced this one
+            if self._pending is not None or self._stopped:
+                return
+            end = min(boundary, covered + self.batch_size)
+            new_messages = [node.message for node in branch[covered:end]]
+            summary = self._summarize(summary, new_messages)
+            with self._lock:
+                self.summaries[branch[end - 1]] = summary
+                self.version += 1
+            covered = end
+
+    def _summarize(self, summary, messages):
+        transcript = "\n\n".join(
+            f"{msg['role'].upper()}: {msg['content']}"
+            for msg in messages
+            if msg["role"] in ("user", "assistant")
+        )
+        if not transcript:
+            return summary
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            system=SUMMARY_PROMPT,
+            messages=[{
+                "role": "user",
+                "content": f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}"
+            }]
+        )
+        on_usage = self.on_usage  # Read once, stop() may clear it meanwhile
+        if on_usage:
+            on_usage(self.model, getattr(response, 'usage', None))
+        return "".join(block.text for block in response.content if hasattr(block, 'text')).strip()
@@ -0,0 +1,193 @@
+class ConversationNode:
+    """A single message in the conversation tree"""
+    __slots__ = ('id', 'parent', 'children', 'active_child', 'message', 'meta')
+
+    def __init__(self, node_id, parent, message, meta=None):
+        self.id = node_id
+        self.parent = parent
+        self.children = []
+        self.active_child = None  # Child that continues the branch being shown
+        self.message = message  # {"role": ..., "content": ...}
+        self.meta = meta  # Optional extras, e.g. the model and usage of a reply
+
+    @property
+    def role(self):
+        return self.message["role"] if self.message else None
+
+    @property
+    def content(self):
+        return self.message["content"] if self.message else None
+
+
+class ConversationTree:
+    """Conversation history stored as a tree of branches.
+
+    Every message is a node pointing at its parent, so branches share their
+    common prefix instead of copying it. The branch shown in the chat (the
+    "active path") is found by following each node's active child from the
+    root.
+    """
+
+    def __init__(self):
+        self.root = ConversationNode(0, None, None)
+        self.nodes = {0: self.root}
+        self._next_id = 1
+        self._path = None  # Cached active path, rebuilt when the tree changes
+        self.version = 0  # Bumped on every change so callers can detect staleness
+
+    def _changed(self):
+        self._path = None
+        self.version += 1
+
+    def get(self, node_id):
+        return self.nodes.get(node_id)
+
+    def path(self):
+        """Return the nodes on the active branch, oldest first"""
+        if self._path is None:
+            path = []
+            node = self.root
+            while node.active_child is not None:
+                node = node.active_child
+                path.append(node)
+            self._path = path
+        return self._path
+
+    def path_to(self, node):
+        """Return the nodes from the first message down to node"""
+        path = []
+        while node is not None and node is not self.root:
+            path.append(node)
+            node = node.parent
+        path.reverse()
+        return path
+
+    def messages(self):
+        """Return the message dicts on the active branch (shared, not copied)"""
+        return [node.message for node in self.path()]
+
+    def leaf(self):
+        path = self.path()
+        return path[-1] if path else self.root
+
+    def append(self, role, content, parent=None, meta=None):
+        """Add a message under parent (default: end of the active branch)"""
+        if parent is None:
+            parent = self.leaf()
+        node = ConversationNode(self._next_id, parent, {"role": role, "content": content}, meta)
+        self._next_id += 1
+        self.nodes[node.id] = node
+        parent.children.append(node)
+        parent.active_child = node
+        self._changed()
+        return node
+
+    def fork(self, index, content):
+        """Create an edited copy of the message at index as a new sibling branch"""
+        node = self.path()[index]
+        meta = {"pinned": True} if self.is_pinned(node) else None  # The edit stays pinned
+        return self.append(node.role, content, parent=node.parent, meta=meta)
+
+    @staticmethod
+    def is_pinned(node):
+        return bool(node.meta and node.meta.get("pinned"))
+
+    def set_pinned(self, node, pinned):
+        """Pin a message so it always stays in the context"""
+        meta = dict(node.meta or {})
+        if pinned:
+            meta["pinned"] = True
+        else:
+            meta.pop("pinned", None)
+        node.meta = meta or None
+        self._changed()
+
+    def remove(self, node):
+        """Detach a node and its descendants from the tree"""
+        parent = node.parent
+        parent.children.remove(node)
+        if parent.active_child is node:
+            parent.active_child = parent.children[-1] if parent.children else None
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self.nodes.pop(current.id, None)
+            stack.extend(current.children)
+        self._changed()
+
+    def select(self, node):
+        """Make node part of the active branch, keeping its own active descendants"""
+        child = node
+        while child.parent is not None:
+            child.parent.active_child = child
+            child = child.parent
+        self._changed()
+
+    def truncate_at(self, node):
+        """Make the active branch end at node"""
+        self.select(node)
+        if node.active_child is not None:
+            node.active_child = None
+            self._changed()
+
+    def branch_info(self, node):
+        """Return (position, count) of node among its siblings, 1-based"""
+        siblings = node.parent.children
+        return siblings.index(node) + 1, len(siblings)
+
+    def switch_branch(self, index, delta):
+        """Show the previous/next sibling of the message at index"""
+        node = self.path()[index]
+        siblings = node.parent.children
+        if len(siblings) < 2:
+            return
+        position = (siblings.index(node) + delta) % len(siblings)
+        node.parent.active_child = siblings[position]
+        self._changed()
+
+    def to_dict(self, skip=()):
+        """Serialize to a compact form: one [parent, role, content(, meta)] row per node.
+
+        Nodes in skip, e.g. replies still streaming, are left out with
+        everything below them.
+        """
+        index_of = {self.root.id: -1}
+        rows = []
+        for node_id in sorted(self.nodes):
+            node = self.nodes[node_id]
+            if node is self.root or node in skip or node.parent.id not in index_of:
+                continue
+            index_of[node.id] = len(rows)
+            row = [index_of[node.parent.id], node.role, node.content]
+            if node.meta:
+                row.append(node.meta)
+            rows.append(row)
+        leaf = self.leaf()
+        while leaf.id not in index_of:
+            leaf = leaf.parent
+        return {
+            "nodes": rows,
+            "active": index_of[leaf.id]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        tree = cls()
+        created = []
+        for row in data.get("nodes", []):
+            parent_index, role, content = row[:3]
+            parent = created[parent_index] if parent_index >= 0 else tree.root
+            meta = row[3] if len(row) > 3 else None
+            created.append(tree.append(role, content, parent=parent, meta=meta))
+        active = data.get("active", -1)
+        if 0 <= active < len(created):
+            tree.truncate_at(created[active])
+        return tree
+
+    @classmethod
+    def from_history(cls, history):
+        """Build a single-branch tree from a flat list of messages"""
+        tree = cls()
+        for msg in history:
+            tree.append(msg["role"], msg["content"])
+        return tree
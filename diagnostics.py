@@ -0,0 +1,214 @@
+import gc
+import sys
+import tkinter as tk
+import tracemalloc
+from tkinter import ttk, scrolledtext
+
+REFRESH_MS = 2000
+TOP_ALLOCATORS = 15
+TRACKED_TYPES = ("EditableMessage", "ConversationNode", "Message")  # Message: API responses
+
+
+def deep_size(obj, seen=None):
+    """Approximate memory of a JSON-like structure (dicts, lists, strings)"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += deep_size(item, seen)
+    return size
+
+
+def count_widgets(widget):
+    """Count widget and all its descendants"""
+    count = 1
+    for child in widget.winfo_children():
+        count += count_widgets(child)
+    return count
+
+
+def count_live_objects(type_names=TRACKED_TYPES):
+    """Count live Python objects by class name; catches widgets kept after destroy"""
+    counts = dict.fromkeys(type_names, 0)
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in counts:
+            counts[name] += 1
+    return counts
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def session_stats(session):
+    """Approximate memory and UI object counts for one chat session"""
+    seen = set()
+    history_bytes = 0
+    for node in session.tree.nodes.values():
+        history_bytes += sys.getsizeof(node) + deep_size(node.message, seen)
+    summary_bytes = 0
+    if session.summarizer:
+        summary_bytes = sum(sys.getsizeof(text) for text in list(session.summarizer.summaries.values()))
+    display = session.chat_display
+    return {
+        "title": session.title,
+        "nodes": len(session.tree.nodes) - 1,
+        "branch_length": len(session.tree.path()),
+        "history_bytes": history_bytes,
+        "summary_bytes": summary_bytes,
+        "attachments": len(session.selected_pdfs),
+        "message_widgets": len(display.messages),
+        "widgets": count_widgets(session.container),
+        "scrollbar_canvas_items": len(display.scrollbar_canvas.find_all()),
+        "chat_canvas_items": len(display.canvas.find_all()),
+        "pending_replies": len(session.pending_replies),
+    }
+
+
+def collect_report(root, services, sessions):
+    """Build a plain text report of where memory and UI objects go"""
+    lines = []
+    sizes = services.attachments.sizes()
+    lines.append("Attachments (shared store)")
+    lines.append(f"  files: {len(sizes)}  base64 data: {format_bytes(sum(sizes.values()))}")
+    for path, size in sorted(sizes.items(), key=lambda item: -item[1])[:5]:
+        lines.append(f"    {format_bytes(size):>10}  {path}")
+
+    lines.append("")
+    lines.append(f"Widgets in window: {count_widgets(root)}")
+    for i, session in enumerate(sessions, 1):
+        stats = session_stats(session)
+        lines.append("")
+        lines.append(f"Session {i}: {stats['title']}")
+        lines.append(f"  history: {stats['nodes']} nodes ({stats['branch_length']} on branch), "
+                     f"{format_bytes(stats['history_bytes'])}")
+        lines.append(f"  summaries: {format_bytes(stats['summary_bytes'])}  "
+                     f"attachments selected: {stats['attachments']}  pending replies: {stats['pending_replies']}")
+        lines.append(f"  widgets: {stats['widgets']}  message widgets: {stats['message_widgets']}")
+        lines.append(f"  canvas items: scrollbar {stats['scrollbar_canvas_items']}, chat {stats['chat_canvas_items']}")
+
+    lines.append("")
+    lines.append("Live objects (after gc)")
+    gc.collect()
+    for name, count in count_live_objects().items():
+        lines.append(f"  {name}: {count}")
+    shown = sum(len(session.chat_display.messages) for session in sessions)
+    lines.append(f"  message widgets on screen: {shown}")
+    return "\n".join(lines)
+
+
+class MemoryTracer:
+    """tracemalloc snapshots with top allocators and growth since the last one"""
+
+    def __init__(self, frames=1):
+        self.frames = frames
+        self.previous = None
+
+    @property
+    def running(self):
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self.previous = None
+
+    def report(self, limit=TOP_ALLOCATORS):
+        if not tracemalloc.is_tracing():
+            return "tracemalloc is not running"
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced: {format_bytes(current)} (peak {format_bytes(peak)})", "", "Top allocators"]
+        for stat in snapshot.statistics('lineno')[:limit]:
+            lines.append(f"  {format_bytes(stat.size):>10}  {stat.count:>7} blocks  {stat.traceback}")
+        if self.previous is not None:
+            lines.append("")
+            lines.append("Growth since previous snapshot")
+            for stat in snapshot.compare_to(self.previous, 'lineno')[:limit]:
+                lines.append(f"  {stat.size_diff / 1024:>+10.1f} KB  {stat.count_diff:>+7} blocks  {stat.traceback}")
+        self.previous = snapshot
+        return "\n".join(lines)
+
+
+class DiagnosticsPanel(tk.Toplevel):
+    """Hidden panel (Ctrl+Shift+D) reporting memory per subsystem"""
+
+    def __init__(self, root, services, get_sessions, tracer=None):
+        super().__init__(root)
+        self.title("Diagnostics")
+        self.geometry("700x600")
+        self.root = root
+        self.services = services
+        self.get_sessions = get_sessions
+        self.tracer = tracer or MemoryTracer()
+        self._after_id = None
+
+        button_frame = ttk.Frame(self)
+        button_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Button(button_frame, text="Refresh", command=self.refresh).pack(side=tk.LEFT, padx=5)
+        self.trace_button = ttk.Button(button_frame, command=self.toggle_tracing)
+        self.trace_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Snapshot", command=self.show_snapshot).pack(side=tk.LEFT, padx=5)
+        self.auto_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="Auto refresh", variable=self.auto_var,
+                        command=self.refresh).pack(side=tk.RIGHT, padx=5)
+
+        self.report_text = scrolledtext.ScrolledText(self, wrap=tk.NONE, height=16, font=("TkFixedFont", 9))
+        self.report_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.trace_text = scrolledtext.ScrolledText(self, wrap=tk.NONE, height=14, font=("TkFixedFont", 9))
+        self.trace_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 5))
+
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self._update_trace_button()
+        self.refresh()
+
+    def refresh(self):
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+            self._after_id = None
+        self._set_text(self.report_text, collect_report(self.root, self.services, self.get_sessions()))
+        if self.auto_var.get():
+            self._after_id = self.after(REFRESH_MS, self.refresh)
+
+    def toggle_tracing(self):
+        if self.tracer.running:
+            self.tracer.stop()
+        else:
+            self.tracer.start()
+        self._update_trace_button()
+
+    def show_snapshot(self):
+        self._set_text(self.trace_text, self.tracer.report())
+
+    def _update_trace_button(self):
+        self.trace_button.configure(text="Stop tracemalloc" if self.tracer.running else "Start tracemalloc")
+
+    def _set_text(self, widget, text):
+        position = widget.yview()[0]
+        widget.delete("1.0", tk.END)
+        widget.insert("1.0", text)
+        widget.yview_moveto(position)
+
+    def close(self):
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+        self.destroy()
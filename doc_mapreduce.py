@@ -0,0 +1,258 @@
+"""Answer questions over many documents with map-reduce.
+
+Instead of one request carrying every PDF, each group of documents is read
+by a request of its own (map), with a bounded number of requests in
+flight. It returns notes on the documents, written with the conversation
+in view; the notes then go into the normal chat request in place of the
+documents (reduce). Notes are cached per document group and model, not per
+question, so follow-up questions reuse them and only groups whose content
+changed, e.g. after adding a PDF, are read again. Notes also go stale when
+a reply says they did not cover the question (see notes_missing), so the
+next request reads the documents again with the new conversation in view.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pdf_ingest import MAX_PDF_PAGES
+
+MAP_CONCURRENCY = 4  # Map requests in flight at once
+MAP_MAX_TOKENS = 2048
+GROUP_BYTES = 8 * 1024 * 1024  # Most base64 data per map request
+GROUP_DOCS = 3  # Most documents per map request
+GROUP_PAGES = MAX_PDF_PAGES  # Most PDF pages per map request, an API limit
+CACHE_SIZE = 256  # Group notes kept per session
+CONTEXT_MESSAGES = 6  # Earlier messages shown to map requests...
+CONTEXT_CHARS = 1500  # ...each cut to this many characters
+
+MAP_PROMPT = (
+    "Write detailed notes on the attached document(s) for someone who will "
+    "answer questions about them without seeing them: what they cover, and "
+    "the key facts, figures, names, dates, definitions and conclusions, "
+    "citing page numbers. Cover everything relevant to the conversation "
+    "below in particular, quoting the passages that answer its latest "
+    "question, since follow-up questions will be answered from these notes "
+    "as well.\n\n<conversation>\n{conversation}\n</conversation>"
+)
+NOTES_MISSING = "[Notes incomplete]"
+REDUCE_PROMPT = (
+    "The attached documents were too many to read at once, so each group of "
+    "documents was read separately and summarized in the notes below. Answer "
+    "my message using these notes and point out where the documents "
+    "disagree. If the notes do not cover what I asked, begin your reply with "
+    f"{NOTES_MISSING} and say what is missing.\n\n"
+    "{notes}\n\nMy message: {question}"
+)
+
+
+class DocumentGroup:
+    """Documents read together in one map request"""
+
+    def __init__(self):
+        self.paths = []
+        self.data = []
+        self.digests = []
+        self.size = 0
+        self.pages = 0
+
+    def add(self, path, data, digest, pages=0):
+        self.paths.append(path)
+        self.data.append(data)
+        self.digests.append(digest)
+        self.size += len(data)
+        self.pages += pages
+
+    @property
+    def key(self):
+        return tuple(self.digests)
+
+    def label(self):
+        return ", ".join(os.path.basename(path) for path in self.paths)
+
+
+def document_digest(data):
+    return hashlib.sha256(data.encode('ascii')).hexdigest()
+
+
+def group_documents(documents, max_bytes=GROUP_BYTES, max_docs=GROUP_DOCS, max_pages=GROUP_PAGES):
+    """Pack (path, data, digest, pages) tuples into groups, keeping their order.
+
+    Groups are filled greedily, so adding a document only changes the last
+    group and the cached notes of the others stay valid.
+    """
+    groups = []
+    for path, data, digest, pages in documents:
+        group = groups[-1] if groups else None
+        if (group is None or len(group.paths) >= max_docs or group.size + len(data) > max_bytes
+                or group.pages + pages > max_pages):
+            group = DocumentGroup()
+            groups.append(group)
+        group.add(path, data, digest, pages)
+    return groups
+
+
+def conversation_excerpt(history, question, count=CONTEXT_MESSAGES, max_chars=CONTEXT_CHARS):
+    """The last messages of history and the new question, for map requests"""
+    parts = []
+    history = [message for message in history if message["role"] in ("user", "assistant")]
+    for message in history[-count:]:
+        content = message["content"]
+        if len(content) > max_chars:
+            content = content[:max_chars] + " [...]"
+        parts.append(f"{message['role']}: {content}")
+    parts.append(f"user (latest question): {question}")
+    return "\n\n".join(parts)
+
+
+class NotesCache:
+    """Notes by (group, model), least recently used dropped first.
+
+    Also tracks the notes being read, so requests running at the same time
+    (e.g. fan-out to one model twice) wait for one read instead of each
+    sending their own.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._notes = OrderedDict()
+        self._reading = {}  # {key: Future} of notes being read
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            notes = self._notes.get(key)
+            if notes is not None:
+                self._notes.move_to_end(key)
+            return notes
+
+    def claim(self, key):
+        """Return (notes, None) when cached, (None, future) when another
+        caller is reading them, else (None, None): the caller reads them
+        and must report with put or fail."""
+        with self._lock:
+            notes = self._notes.get(key)
+            if notes is not None:
+                self._notes.move_to_end(key)
+                return notes, None
+            future = self._reading.get(key)
+            if future is None:
+                self._reading[key] = Future()
+            return None, future
+
+    def put(self, key, notes):
+        with self._lock:
+            self._notes[key] = notes
+            self._notes.move_to_end(key)
+            while len(self._notes) > self.size:
+                self._notes.popitem(last=False)
+            future = self._reading.pop(key, None)
+        if future is not None:
+            future.set_result(notes)
+
+    def fail(self, key, error):
+        with self._lock:
+            future = self._reading.pop(key, None)
+        if future is not None:
+            future.set_exception(error)
+
+    def discard(self, keys):
+        """Forget notes that turned out not to be good enough"""
+        with self._lock:
+            for key in keys:
+                self._notes.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._notes.clear()
+
+
+def _map_request(group, conversation, model, max_tokens):
+    content = [{
+        "type": "document",
+        "source": {"type": "base64", "media_type": "application/pdf", "data": data}
+    } for data in group.data]
+    # Cache the documents, so re-reading this group later is cheaper
+    content[-1] = dict(content[-1], cache_control={"type": "ephemeral"})
+    content.append({"type": "text", "text": MAP_PROMPT.format(conversation=conversation)})
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "temperature": 0.0,
+        "messages": [{"role": "user", "content": content}]
+    }
+
+
+def map_documents(client, groups, conversation, model, cache, concurrency=MAP_CONCURRENCY,
+                  max_tokens=MAP_MAX_TOKENS, on_progress=None, on_usage=None):
+    """Notes on every group, in group order.
+
+    Runs on a worker thread. conversation (see conversation_excerpt) guides
+    notes that have to be written; cached notes are reused whatever the
+    question, and notes another caller is reading are waited for.
+    on_progress(done, total) is called as notes come in, on_usage(group,
+    usage) after every request actually made.
+    """
+    notes = [None] * len(groups)
+    todo = []
+    waiting = []  # (index, future) of notes read by another caller
+    for i, group in enumerate(groups):
+        notes[i], future = cache.claim((group.key, model))
+        if future is not None:
+            waiting.append((i, future))
+        elif notes[i] is None:
+            todo.append(i)
+    done = len(groups) - len(todo) - len(waiting)
+    lock = threading.Lock()
+    if on_progress:
+        on_progress(done, len(groups))
+
+    def finished(i, text):
+        nonlocal done
+        notes[i] = text
+        with lock:
+            done += 1
+            if on_progress:
+                on_progress(done, len(groups))
+
+    def read(i):
+        group = groups[i]
+        try:
+            response = client.messages.create(**_map_request(group, conversation, model, max_tokens))
+        except Exception as e:
+            cache.fail((group.key, model), e)  # Callers waiting for it fail too
+            raise
+        if on_usage:
+            on_usage(group, getattr(response, 'usage', None))
+        text = "".join(block.text for block in response.content if hasattr(block, 'text')).strip()
+        cache.put((group.key, model), text)
+        finished(i, text)
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="doc-map") as pool:
+            # list() re-raises the first failure
+            list(pool.map(read, todo))
+    for i, future in waiting:
+        finished(i, future.result())
+    return notes
+
+
+def notes_missing(reply):
+    """Whether a reduce reply says the notes did not cover the question"""
+    return reply.lstrip().startswith(NOTES_MISSING)
+
+
+def reduce_message(groups, notes, question, blocks=()):
+    """The user message that replaces the documents in the final request.
+
+    blocks are other attachments of the original message, e.g. images,
+    which are kept in front of the text as they were.
+    """
+    parts = []
+    for i, (group, text) in enumerate(zip(groups, notes), 1):
+        parts.append(f"<document_notes group=\"{i}\" documents=\"{group.label()}\">\n{text}\n</document_notes>")
+    text = REDUCE_PROMPT.format(notes="\n\n".join(parts), question=question)
+    if blocks:
+        return {"role": "user", "content": list(blocks) + [{"type": "text", "text": text}]}
+    return {"role": "user", "content": text}
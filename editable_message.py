@@ -6,14 +6,24 @@
 
 import tkinter as tk
 from tkinter import ttk, Text
+from markdown_view import MarkdownView
 
 class EditableMessage(ttk.Frame):
-    def __init__(self, parent, content, role, in_context=True, on_edit=None):
+    def __init__(self, parent, content, role, in_context=True, on_edit=None,
+                 branch=None, on_switch_branch=None, on_regenerate=None,
+                 pinned=False, on_toggle_pin=None, can_edit=None):
         super().__init__(parent)
         self.content = content  # Store original content
         self.role = role
         self.on_edit = on_edit
+        self.branch = branch  # (position, count) among alternative versions
+        self.on_switch_branch = on_switch_branch
+        self.on_regenerate = on_regenerate
+        self.pinned = pinned  # Always kept in the context
+        self.on_toggle_pin = on_toggle_pin
+        self.can_edit = can_edit  # False while e.g. the reply is still streaming
         self.is_editing = False
+        self.edit_original = None  # Content when editing started
         self.in_context = in_context
         
         self.role_colors = {
@@ -42,6 +52,39 @@ class EditableMessage(ttk.Frame):
             bg=header_bg
         )
         self.role_label.pack(side=tk.LEFT)
+        self.header_labels = [self.role_label]
+        
+        # Branch navigation (only when this message has alternative versions)
+        if self.branch and self.branch[1] > 1 and self.on_switch_branch:
+            position, count = self.branch
+            for text, delta in (("<", -1), (f"{position}/{count}", 0), (">", 1)):
+                label = tk.Label(self.header_frame, text=text, fg="gray40", bg=header_bg)
+                if delta:
+                    label.configure(cursor="hand2")
+                    label.bind('<Button-1>', lambda e, d=delta: self.on_switch_branch(d))
+                label.pack(side=tk.LEFT, padx=(4, 0))
+                self.header_labels.append(label)
+        
+        # Regenerate action for user prompts and assistant replies
+        if self.on_regenerate and self.role in ("user", "assistant"):
+            regenerate_label = tk.Label(
+                self.header_frame,
+                text="Regenerate",
+                fg="gray40",
+                bg=header_bg,
+                cursor="hand2"
+            )
+            regenerate_label.bind('<Button-1>', lambda e: self.on_regenerate())
+            regenerate_label.pack(side=tk.RIGHT, padx=(8, 0))
+            self.header_labels.append(regenerate_label)
+        
+        # Pin toggle, pinned messages never leave the context window
+        if self.on_toggle_pin and self.role in ("user", "assistant"):
+            self.pin_label = tk.Label(self.header_frame, bg=header_bg, cursor="hand2")
+            self.pin_label.bind('<Button-1>', lambda e: self.on_toggle_pin())
+            self.pin_label.pack(side=tk.RIGHT, padx=(8, 0))
+            self.header_labels.append(self.pin_label)
+            self._update_pin_label()
         
         # Context indicator (if out of context)
         if not self.in_context:
@@ -64,14 +107,27 @@ class EditableMessage(ttk.Frame):
         style.configure(style_name, background=self.role_colors[self.role][1])
         self.content_frame.configure(style=style_name)
         
-        # Message content label
-        self.message_label = ttk.Label(
-            self.content_frame,
-            text=self.content,
-            wraplength=700,
-            justify='left',
-            background=self.role_colors[self.role][1]
-        )
+        # Message content: replies are rendered as Markdown, other messages as plain text
+        if self.role == "assistant":
+            self.message_label = MarkdownView(
+                self.content_frame,
+                background=self.role_colors[self.role][1],
+                on_click=self.start_editing
+            )
+            self.message_label.set_text(self.content)
+        else:
+            self.message_label = ttk.Label(
+                self.content_frame,
+                text=self.content,
+                wraplength=700,
+                justify='left',
+                background=self.role_colors[self.role][1]
+            )
+            # Rewrap to the available width when the window is resized
+            self.message_label.bind(
+                '<Configure>',
+                lambda e: self.message_label.configure(wraplength=max(100, e.width - 10))
+            )
         self.message_label.pack(fill=tk.X, padx=5, pady=5)
         
         # Edit text widget (hidden initially)
@@ -92,13 +148,24 @@ class EditableMessage(ttk.Frame):
         self.text_widget.configure(yscrollcommand=self.scrollbar.set)
         
         # Bindings
-        self.message_label.bind('<Button-1>', self.start_editing)
+        if not isinstance(self.message_label, MarkdownView):  # The view handles its own clicks
+            self.message_label.bind('<Button-1>', self.start_editing)
         self.text_widget.bind('<FocusOut>', self.stop_editing)
-        self.text_widget.bind('<Return>', lambda e: self.stop_editing(e) if not e.state & 0x1 else None)
+        self.text_widget.bind('<Return>', self._handle_return)
+        
+    def _handle_return(self, event):
+        """Return finishes the edit, Shift+Return inserts a newline"""
+        if event.state & 0x1:
+            return None
+        self.stop_editing(event)
+        return "break"  # The widget may be rebuilt, skip the default newline insert
         
     def start_editing(self, event=None):
+        if self.can_edit and not self.can_edit():
+            return
         if not self.is_editing:
             self.is_editing = True
+            self.edit_original = self.content
             self.message_label.pack_forget()
             self.text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
             self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y, pady=5)
@@ -111,14 +178,41 @@ class EditableMessage(ttk.Frame):
         if self.is_editing:
             self.is_editing = False
             new_content = self.text_widget.get('1.0', 'end-1c').rstrip()
-            self.content = new_content  # Update stored content
-            self.message_label.configure(text=new_content)
+            # Compared with what the editor started from, the content may have moved on since
+            changed = new_content != self.edit_original.rstrip()
+            if changed:
+                self.content = new_content
+            self._show_content(self.content)
             self.text_widget.pack_forget()
             self.scrollbar.pack_forget()
             self.message_label.pack(fill=tk.X, padx=5, pady=5)
-            if self.on_edit:
+            # Only report real edits, leaving focus alone should not fork a branch
+            if self.on_edit and changed:
                 self.on_edit(new_content)
                 
+    def set_content(self, content):
+        """Show new content, e.g. while a reply streams in"""
+        self.content = content
+        if not self.is_editing:
+            self._show_content(content)
+            
+    def _show_content(self, content):
+        if isinstance(self.message_label, MarkdownView):
+            self.message_label.set_text(content)  # Only re-renders what changed
+        else:
+            self.message_label.configure(text=content)
+            
+    def set_pinned(self, pinned):
+        self.pinned = pinned
+        if hasattr(self, 'pin_label'):
+            self._update_pin_label()
+            
+    def _update_pin_label(self):
+        if self.pinned:
+            self.pin_label.configure(text="Pinned", fg="#b8860b", font=("TkDefaultFont", 9, "bold"))
+        else:
+            self.pin_label.configure(text="Pin", fg="gray40", font=("TkDefaultFont", 9))
+            
     def adjust_text_height(self):
         num_lines = int(self.text_widget.index('end-1c').split('.')[0])
         self.text_widget.configure(height=max(4, min(num_lines, 20)))
@@ -134,7 +228,8 @@ class EditableMessage(ttk.Frame):
             
             # Update header frame background
             self.header_frame.configure(bg=header_bg)
-            self.role_label.configure(bg=header_bg)
+            for label in self.header_labels:
+                label.configure(bg=header_bg)
             
             # Update context indicator
             if in_context:
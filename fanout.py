@@ -0,0 +1,154 @@
+import time
+import tkinter as tk
+from tkinter import ttk, scrolledtext
+
+
+class FanoutConfig:
+    """One model/settings combination to send the prompt to"""
+    __slots__ = ('model', 'temperature', 'max_tokens')
+
+    def __init__(self, model, temperature, max_tokens):
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    def label(self):
+        return f"{self.model}  t={self.temperature:g}  max={self.max_tokens}"
+
+
+def parse_configs(text, default_temperature, default_max_tokens):
+    """Parse "model [temperature] [max_tokens]" lines; raises ValueError on bad input"""
+    configs = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        parts = line.split('#', 1)[0].split()
+        if not parts:
+            continue
+        if len(parts) > 3:
+            raise ValueError(f"Line {line_number}: expected 'model [temperature] [max_tokens]'")
+        temperature = float(parts[1]) if len(parts) > 1 else default_temperature
+        max_tokens = int(parts[2]) if len(parts) > 2 else default_max_tokens
+        configs.append(FanoutConfig(parts[0], temperature, max_tokens))
+    if not configs:
+        raise ValueError("Add at least one configuration")
+    return configs
+
+
+class FanoutWindow(tk.Toplevel):
+    """Sends one prompt to several configurations and shows the replies side by side.
+
+    The configurations are edited at the top, one per line. Run hands them
+    to on_run, which starts the requests; the replies then stream into one
+    column each, with latency and token usage underneath.
+    """
+
+    def __init__(self, root, configs_text, on_run):
+        super().__init__(root)
+        self.title("Compare Models")
+        self.geometry("1000x600")
+        self.on_run = on_run
+        self.columns = []
+        self.started = None
+
+        config_frame = ttk.LabelFrame(self, text="Configurations: model [temperature] [max_tokens], one per line")
+        config_frame.pack(fill=tk.X, padx=10, pady=5)
+        self.config_input = tk.Text(config_frame, height=4, wrap=tk.NONE)
+        self.config_input.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5, pady=5)
+        self.config_input.insert("1.0", configs_text)
+        self.run_button = ttk.Button(config_frame, text="Run", command=self._run)
+        self.run_button.pack(side=tk.RIGHT, padx=5)
+
+        self.prompt_label = ttk.Label(self, text="Type a prompt in the chat input, then press Run", wraplength=960)
+        self.prompt_label.pack(fill=tk.X, padx=10)
+
+        self.columns_frame = ttk.Frame(self)
+        self.columns_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        self.summary_label = ttk.Label(self, text="")
+        self.summary_label.pack(fill=tk.X, padx=10, pady=(0, 5))
+
+    def get_configs_text(self):
+        return self.config_input.get("1.0", "end-1c")
+
+    def _run(self):
+        self.on_run(self.get_configs_text())
+
+    def start(self, prompt, configs):
+        """Lay out one empty column per configuration"""
+        for column in self.columns:
+            column["frame"].destroy()
+        self.columns = []
+        self.started = time.perf_counter()
+        self.prompt_label.configure(text=f"Prompt: {prompt}")
+        self.summary_label.configure(text="Running...")
+        for i, config in enumerate(configs):
+            frame = ttk.Frame(self.columns_frame)
+            frame.grid(row=0, column=i, sticky="nsew", padx=3)
+            self.columns_frame.columnconfigure(i, weight=1, uniform="column")
+            ttk.Label(frame, text=config.label(), font=("TkDefaultFont", 9, "bold")).pack(fill=tk.X)
+            text = scrolledtext.ScrolledText(frame, wrap=tk.WORD, width=10, state=tk.DISABLED)
+            text.pack(fill=tk.BOTH, expand=True)
+            metrics = ttk.Label(frame, text="waiting for first token...", wraplength=300)
+            metrics.pack(fill=tk.X)
+            self.columns.append({"frame": frame, "text": text, "metrics": metrics, "done": False, "total": None})
+        self.columns_frame.rowconfigure(0, weight=1)
+
+    def append_text(self, index, text):
+        widget = self.columns[index]["text"]
+        widget.configure(state=tk.NORMAL)
+        widget.insert(tk.END, text)
+        widget.configure(state=tk.DISABLED)
+        widget.see(tk.END)
+
+    def finish(self, index, latency, usage):
+        column = self.columns[index]
+        parts = []
+        if latency.get("first_token") is not None:
+            parts.append(f"first token {latency['first_token']:.2f}s")
+        parts.append(f"total {latency['total']:.2f}s")
+        if usage:
+            parts.append(f"in {usage.get('input_tokens', 0)} / out {usage.get('output_tokens', 0)} tokens")
+            cached = usage.get('cache_read_input_tokens') or 0
+            if cached:
+                parts.append(f"cache read {cached}")
+        column["metrics"].configure(text="  ".join(parts))
+        column["total"] = latency["total"]
+        self._mark_done(index)
+
+    def fail(self, index, error):
+        self.columns[index]["metrics"].configure(text=f"Error: {error}", foreground="#d32f2f")
+        self._mark_done(index)
+
+    def _mark_done(self, index):
+        self.columns[index]["done"] = True
+        if all(column["done"] for column in self.columns):
+            wall = time.perf_counter() - self.started
+            calls = sum(column["total"] or 0 for column in self.columns)
+            self.summary_label.configure(
+                text=f"All done: wall clock {wall:.2f}s (slowest call), calls added up {calls:.2f}s"
+            )
+
+
+class FanoutListener:
+    """Forwards one streaming reply to its column in a FanoutWindow"""
+
+    def __init__(self, window, index):
+        self.window = window
+        self.index = index
+
+    def _alive(self):
+        try:
+            return self.window.winfo_exists()
+        except tk.TclError:
+            return False
+
+    def on_text(self, text):
+        if self._alive():
+            self.window.append_text(self.index, text)
+
+    def on_finish(self, latency, usage):
+        if self._alive():
+            self.window.finish(self.index, latency, usage)
+
+    def on_error(self, error):
+        if self._alive():
+            self.window.fail(self.index, error)
@@ -0,0 +1,128 @@
+"""Image attachments, downscaled and re-encoded before they are sent.
+
+The model gains nothing from more than about 1.15 megapixels (long edge at
+most 1568 px), and input tokens grow with the pixel count, so screenshots
+and photos are shrunk to that size and saved as WebP (or JPEG where Pillow
+lacks WebP support). Results are cached by a hash of the original file, so
+the same image added again, from any tab, is not decoded twice.
+"""
+import base64
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps, features
+
+from pdf_ingest import CHUNK_SIZE, PROGRESS_STEP, AttachmentRejected
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp', '.tif', '.tiff')
+MAX_IMAGE_BYTES = 50 * 1024 * 1024  # Original file
+MAX_EDGE = 1568
+MAX_PIXELS = 1_150_000
+QUALITY = 85
+CACHE_BYTES = 64 * 1024 * 1024  # Encoded results kept in memory
+
+if features.check('webp'):
+    OUTPUT_FORMAT, OUTPUT_MEDIA_TYPE = "WEBP", "image/webp"
+else:
+    OUTPUT_FORMAT, OUTPUT_MEDIA_TYPE = "JPEG", "image/jpeg"
+
+
+def is_image(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+class ProcessedImageCache:
+    """Encoded images by content hash, least recently used dropped first"""
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # {digest: (base64 data, media type, size)}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            item = self._items.get(digest)
+            if item is not None:
+                self._items.move_to_end(digest)
+            return item
+
+    def put(self, digest, item):
+        with self._lock:
+            if digest in self._items:
+                return
+            self._items[digest] = item
+            self._bytes += len(item[0])
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, (data, _, _) = self._items.popitem(last=False)
+                self._bytes -= len(data)
+
+
+_cache = ProcessedImageCache()
+
+
+def target_size(width, height, max_edge=MAX_EDGE, max_pixels=MAX_PIXELS):
+    """Largest size with the same aspect ratio within both limits"""
+    scale = min(1.0, max_edge / max(width, height), (max_pixels / (width * height)) ** 0.5)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def process_image(raw):
+    """Downscale and re-encode image bytes; returns (base64 data, media type, (width, height))"""
+    with Image.open(io.BytesIO(raw)) as image:
+        image = ImageOps.exif_transpose(image)  # Phone photos store their rotation separately
+        if image.mode in ("RGBA", "LA", "P"):
+            # Flatten transparency onto white, like the screenshot would be seen
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        size = target_size(*image.size)
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format=OUTPUT_FORMAT, quality=QUALITY)
+    return base64.b64encode(output.getvalue()).decode('ascii'), OUTPUT_MEDIA_TYPE, size
+
+
+def ingest_image(job, on_progress=None, max_bytes=MAX_IMAGE_BYTES, cache=_cache):
+    """Read, shrink and base64-encode job.path; same contract as ingest_pdf.
+
+    Sets job.media_type to the encoded format. Runs on a worker thread.
+    """
+    with open(job.path, 'rb') as f:
+        f.seek(0, 2)
+        job.size = f.tell()
+        if job.size > max_bytes:
+            raise AttachmentRejected(f"{job.name} is {job.size / (1024 * 1024):.1f} MB, "
+                                     f"the limit is {max_bytes / (1024 * 1024):.0f} MB")
+        f.seek(0)
+        chunks = []
+        digest = hashlib.sha256()
+        reported = 0.0
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if job.cancelled:
+                return None
+            chunks.append(chunk)
+            digest.update(chunk)
+            job.read += len(chunk)
+            if on_progress and job.progress - reported >= PROGRESS_STEP:
+                reported = job.progress
+                on_progress(job)
+    key = digest.hexdigest()
+
+    cached = cache.get(key)
+    if cached is None:
+        try:
+            cached = process_image(b"".join(chunks))
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise AttachmentRejected(f"{job.name} could not be read as an image: {e}")
+        cache.put(key, cached)
+    data, job.media_type, _ = cached
+    return data
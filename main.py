@@ -1,10 +1,15 @@
 
 import tkinter as tk
-from chat_app import ClaudeChatApp
+from chat_tabs import ChatTabs
+from chat_services import create_client
+from api_harness import RecordingClient, ReplayClient, PROFILES
+from stall_watchdog import StallWatchdog
 import os
 from PIL import Image, ImageTk  # Make sure to pip install pillow
 import sys
 import ctypes
+import argparse
+import tracemalloc
 
 def create_ico_from_png(png_path, ico_path):
     """Convert PNG to ICO if needed"""
@@ -39,7 +44,36 @@ def set_windows_taskbar_icon(window, icon_path):
         except Exception as e:
             print(f"Could not set Windows taskbar icon: {e}")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Claude Chat Interface")
+    parser.add_argument("--diagnostics", action="store_true",
+                        help="open the memory diagnostics panel and trace allocations from startup")
+    parser.add_argument("--record", metavar="DIR",
+                        help="record API requests and responses into cassette files in DIR")
+    parser.add_argument("--replay", metavar="DIR",
+                        help="serve recorded cassettes from DIR instead of calling the API")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="recorded",
+                        help="latency and error profile used with --replay")
+    parser.add_argument("--watch-stalls", metavar="MS", type=int, nargs="?", const=200,
+                        help="report UI freezes longer than MS milliseconds (default 200)")
+    parser.add_argument("--stall-log", metavar="FILE",
+                        help="append each stall with its sampled stack to FILE as JSON lines")
+    return parser.parse_args()
+
+def build_client(args):
+    """Real API client, optionally recorded, or an offline replay stand-in"""
+    if args.replay:
+        return ReplayClient(args.replay, PROFILES[args.profile])
+    client = create_client()
+    if client and args.record:
+        client = RecordingClient(client, args.record)
+    return client
+
 def main():
+    args = parse_args()
+    if args.diagnostics:
+        tracemalloc.start()
+    
     root = tk.Tk()
     
     # Set up icon paths
@@ -63,8 +97,17 @@ def main():
     except Exception as e:
         print(f"Could not set icon: {e}")
     
-    app = ClaudeChatApp(root)
+    watchdog = None
+    if args.watch_stalls:
+        watchdog = StallWatchdog(root, threshold_ms=args.watch_stalls, log_path=args.stall_log)
+        watchdog.start()
+    
+    app = ChatTabs(root, client=build_client(args), diagnostics=args.diagnostics)
     root.mainloop()
+    
+    if watchdog:
+        watchdog.stop()
+        print(watchdog.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,323 @@
+import re
+import tkinter as tk
+import tkinter.font as tkfont
+from collections import OrderedDict
+
+COLLAPSE_CHARS = 8000  # Longer messages start collapsed to a preview...
+PREVIEW_CHARS = 2000  # ...of about this many characters
+PARSE_CACHE_SIZE = 200  # Parsed messages kept, so rebuilt widgets skip parsing
+
+FENCE = re.compile(r"^\s*(```|~~~)\s*([\w+-]*)")
+HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+ITEM = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+QUOTE = re.compile(r"^\s*>\s?(.*)$")
+INLINE = re.compile(r"(`[^`\n]+`|\*\*[^*\n]+\*\*|__[^_\n]+__|(?<![*\w])\*[^*\n]+\*(?![*\w])|(?<![_\w])_[^_\n]+_(?![_\w]))")
+
+
+class Block:
+    """One parsed block: kind, its inline runs and where it starts in the source"""
+    __slots__ = ('start', 'kind', 'level', 'runs')
+
+    def __init__(self, start, kind, runs, level=0):
+        self.start = start
+        self.kind = kind  # paragraph, heading, code, item, quote, rule
+        self.level = level  # Heading level or list indent
+        self.runs = runs  # [(text, tag or None)]
+
+    def length(self):
+        return sum(len(text) for text, _ in self.runs)
+
+
+def parse_inline(text):
+    """Split text into (text, tag) runs for `code`, **bold** and *italic*"""
+    runs = []
+    position = 0
+    for match in INLINE.finditer(text):
+        if match.start() > position:
+            runs.append((text[position:match.start()], None))
+        token = match.group(0)
+        if token.startswith("`"):
+            runs.append((token[1:-1], "code"))
+        elif token.startswith(("**", "__")):
+            runs.append((token[2:-2], "bold"))
+        else:
+            runs.append((token[1:-1], "italic"))
+        position = match.end()
+    if position < len(text):
+        runs.append((text[position:], None))
+    return runs
+
+
+def parse_blocks(text, offset=0):
+    """Parse text[offset:] into Blocks; offset must be at the start of a line"""
+    blocks = []
+    lines = text[offset:].split("\n")
+    position = offset
+    paragraph = None  # (start, [lines]) being collected
+    i = 0
+
+    def end_paragraph():
+        nonlocal paragraph
+        if paragraph:
+            blocks.append(Block(paragraph[0], "paragraph", parse_inline("\n".join(paragraph[1]))))
+            paragraph = None
+
+    while i < len(lines):
+        line = lines[i]
+        line_start = position
+        position += len(line) + 1
+        i += 1
+
+        fence = FENCE.match(line)
+        if fence:
+            end_paragraph()
+            code = []
+            while i < len(lines) and not lines[i].strip().startswith(fence.group(1)):
+                code.append(lines[i])
+                position += len(lines[i]) + 1
+                i += 1
+            if i < len(lines):  # Closing fence
+                position += len(lines[i]) + 1
+                i += 1
+            blocks.append(Block(line_start, "code", [("\n".join(code), None)]))
+            continue
+        if not line.strip():
+            end_paragraph()
+            continue
+        heading = HEADING.match(line)
+        if heading:
+            end_paragraph()
+            blocks.append(Block(line_start, "heading", parse_inline(heading.group(2)), len(heading.group(1))))
+            continue
+        if RULE.match(line):
+            end_paragraph()
+            blocks.append(Block(line_start, "rule", [("", None)]))
+            continue
+        item = ITEM.match(line)
+        if item:
+            end_paragraph()
+            indent = len(item.group(1).expandtabs(4)) // 2
+            marker = item.group(2)
+            bullet = "\u2022 " if marker in "-*+" else f"{marker} "
+            blocks.append(Block(line_start, "item", [(bullet, None)] + parse_inline(item.group(3)), indent))
+            continue
+        quote = QUOTE.match(line)
+        if quote:
+            end_paragraph()
+            blocks.append(Block(line_start, "quote", parse_inline(quote.group(1))))
+            continue
+        if paragraph is None:
+            paragraph = (line_start, [])
+        paragraph[1].append(line)
+    end_paragraph()
+    return blocks
+
+
+def reparse(blocks, text):
+    """Blocks of text, given the blocks of a text it extends.
+
+    Everything before the last block is final, so only text from the start
+    of the last block on is parsed again. Gives the same blocks as
+    parse_blocks(text).
+    """
+    if not blocks:
+        return parse_blocks(text)
+    return blocks[:-1] + parse_blocks(text, blocks[-1].start)
+
+
+_parse_cache = OrderedDict()
+
+
+def parse_cached(text):
+    """parse_blocks for a whole message, remembering recent results"""
+    blocks = _parse_cache.get(text)
+    if blocks is None:
+        blocks = parse_blocks(text)
+        _parse_cache[text] = blocks
+        while len(_parse_cache) > PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+    else:
+        _parse_cache.move_to_end(text)
+    return blocks
+
+
+def _fonts(widget):
+    """Bold, italic, code and heading fonts derived from the default font, made once"""
+    if MarkdownView.fonts is None:
+        base = tkfont.nametofont("TkDefaultFont", root=widget).actual()
+        fixed = tkfont.nametofont("TkFixedFont", root=widget).actual()
+        size = abs(base["size"])
+        MarkdownView.fonts = {
+            "bold": tkfont.Font(root=widget, **dict(base, weight="bold")),
+            "italic": tkfont.Font(root=widget, **dict(base, slant="italic")),
+            "code": tkfont.Font(root=widget, **fixed),
+            "heading1": tkfont.Font(root=widget, **dict(base, size=size + 5, weight="bold")),
+            "heading2": tkfont.Font(root=widget, **dict(base, size=size + 3, weight="bold")),
+            "heading3": tkfont.Font(root=widget, **dict(base, size=size + 1, weight="bold")),
+        }
+    return MarkdownView.fonts
+
+
+class MarkdownView(tk.Text):
+    """Read-only Text showing Markdown, updated incrementally as text grows.
+
+    When new text extends what is shown (a streaming reply), only the last
+    block is parsed and drawn again; the blocks before it are final. The
+    widget wraps to its own width and resizes its height to fit, so it
+    reflows with the window. Messages longer than COLLAPSE_CHARS start as a
+    preview with a link that renders the rest on demand.
+    """
+    fonts = None  # Shared by all views, see _fonts
+
+    def __init__(self, parent, background, on_click=None, **kwargs):
+        super().__init__(
+            parent, wrap=tk.WORD, width=1, height=1, background=background,
+            relief=tk.FLAT, borderwidth=0, highlightthickness=0, padx=5, pady=5,
+            cursor="arrow", **kwargs
+        )
+        self.on_click = on_click
+        self.source = ""
+        self.blocks = []
+        self.rendered = 0  # Blocks drawn, fewer than len(blocks) while collapsed
+        self.collapsed = False
+        self._height_after = None
+
+        fonts = _fonts(self)
+        self.tag_configure("heading1", font=fonts["heading1"], spacing1=6, spacing3=4)
+        self.tag_configure("heading2", font=fonts["heading2"], spacing1=6, spacing3=3)
+        self.tag_configure("heading3", font=fonts["heading3"], spacing1=4, spacing3=2)
+        self.tag_configure("paragraph", spacing3=6)
+        self.tag_configure("item", spacing3=2)
+        self.tag_configure("quote", foreground="gray30", lmargin1=15, lmargin2=15, spacing3=2)
+        self.tag_configure("codeblock", font=fonts["code"], background="#f3f3f3",
+                           lmargin1=10, lmargin2=10, wrap=tk.CHAR, spacing3=6)
+        self.tag_configure("rule", overstrike=True, foreground="gray60", spacing3=6)
+        self.tag_configure("code", font=fonts["code"], background="#ececec")
+        self.tag_configure("bold", font=fonts["bold"])
+        self.tag_configure("italic", font=fonts["italic"])
+        self.tag_configure("expand", foreground="#0056b3", underline=True)
+        self.tag_bind("expand", "<Enter>", lambda e: self.configure(cursor="hand2"))
+        self.tag_bind("expand", "<Leave>", lambda e: self.configure(cursor="arrow"))
+
+        self.bind("<Button-1>", self._on_click)
+        self.bind("<Configure>", lambda e: self._schedule_height())
+        self.configure(state=tk.DISABLED)
+
+    def set_text(self, text):
+        """Show text, re-rendering only what changed if it extends the current text"""
+        if text == self.source:
+            return
+        if self.blocks and text.startswith(self.source) and not self.collapsed:
+            keep = len(self.blocks) - 1  # Only the last block can change
+            self.blocks = reparse(self.blocks, text)
+        else:
+            keep = 0
+            self.blocks = parse_cached(text)
+            # Long messages that arrive all at once start collapsed
+            self.collapsed = not self.source and len(text) > COLLAPSE_CHARS
+        self.source = text
+        if self.collapsed:
+            self._render_preview()
+        else:
+            self._render_from(min(keep, self.rendered))
+        self._schedule_height()
+
+    def expand(self):
+        if self.collapsed:
+            self.collapsed = False
+            self._render_from(self.rendered)
+            self._schedule_height()
+
+    def _render_preview(self):
+        # Blocks up to PREVIEW_CHARS, then a link to the rest
+        count = 0
+        shown = 0
+        for block in self.blocks:
+            if count and shown + block.length() > PREVIEW_CHARS:
+                break
+            shown += block.length()
+            count += 1
+        self.configure(state=tk.NORMAL)
+        self.delete("1.0", tk.END)
+        self.rendered = 0
+        self._insert_blocks(self.blocks[:count])
+        remaining = len(self.source) - self.blocks[count].start if count < len(self.blocks) else 0
+        if remaining:
+            # expand() redraws from here, replacing the link
+            mark = f"block{self.rendered}"
+            self.mark_set(mark, "end-1c")
+            self.mark_gravity(mark, tk.LEFT)
+            self.insert(tk.END, f"\nShow full message ({remaining:,} more characters)", "expand")
+        self.configure(state=tk.DISABLED)
+
+    def _render_from(self, index):
+        """Redraw blocks from index on, keeping the ones before it"""
+        self.configure(state=tk.NORMAL)
+        if index == 0:
+            self.delete("1.0", tk.END)
+        else:
+            self.delete(f"block{index}", tk.END)
+        for i in range(index, self.rendered + 1):
+            self.mark_unset(f"block{i}")
+        self.rendered = index
+        self._insert_blocks(self.blocks[index:])
+        self.configure(state=tk.DISABLED)
+
+    def _insert_blocks(self, blocks):
+        for block in blocks:
+            # A mark before each block lets a later update redraw from there
+            mark = f"block{self.rendered}"
+            self.mark_set(mark, "end-1c")
+            self.mark_gravity(mark, tk.LEFT)
+            if self.rendered:
+                self.insert(tk.END, "\n")
+            if block.kind == "heading":
+                tag = f"heading{min(block.level, 3)}"
+            elif block.kind == "code":
+                tag = "codeblock"
+            else:
+                tag = block.kind
+            start = self.index("end-1c")
+            if block.kind == "rule":
+                self.insert(tk.END, " " * 40)
+            for text, inline_tag in block.runs:
+                self.insert(tk.END, text, inline_tag)
+            self.tag_add(tag, start, "end-1c")
+            if block.kind == "item":
+                # Wrapped lines line up after the bullet
+                indent = 10 + block.level * 15
+                item_tag = f"item{block.level}"
+                self.tag_configure(item_tag, lmargin1=indent, lmargin2=indent + 12)
+                self.tag_add(item_tag, start, "end-1c")
+            self.rendered += 1
+
+    def _schedule_height(self):
+        if self._height_after is None:
+            self._height_after = self.after_idle(self._fit_height)
+
+    def _fit_height(self):
+        """Resize to the number of display lines at the current width"""
+        self._height_after = None
+        try:
+            lines = self.count("1.0", "end-1c", "update", "displaylines")
+        except tk.TclError:
+            return
+        lines = (lines[0] if isinstance(lines, tuple) else lines) or 0
+        height = max(1, lines + 1)
+        if int(self.cget("height")) != height:
+            self.configure(height=height)
+
+    def _on_click(self, event):
+        if "expand" in self.tag_names(f"@{event.x},{event.y}"):
+            self.expand()
+            return "break"
+        if self.on_click:
+            self.on_click(event)
+        return "break"
+
+    def destroy(self):
+        if self._height_after is not None:
+            self.after_cancel(self._height_after)
+            self._height_after = None
+        super().destroy()
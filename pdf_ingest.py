@@ -0,0 +1,121 @@
+import base64
+import os
+import re
+
+# API limits for PDF documents: 32 MB and 100 pages per request, counted over
+# all PDFs in it. Base64 grows data by a third, so a single file has to stay
+# below 24 MB; no single file can have more pages than a whole request.
+MAX_REQUEST_BYTES = 32 * 1024 * 1024
+MAX_PDF_BYTES = MAX_REQUEST_BYTES * 3 // 4
+MAX_PDF_PAGES = 100
+CHUNK_SIZE = 3 * 256 * 1024  # Multiple of 3, so base64 chunks join without padding
+PROGRESS_STEP = 0.05  # Report progress in 5% steps
+
+# Page objects ("/Type /Page", not "/Pages") and page tree nodes ("/Type /Pages").
+# Only a page tree node's /Count is a page count; outlines have a /Count too
+PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+PAGES_PATTERN = re.compile(rb"/Type\s*/Pages(?![a-zA-Z])")
+COUNT_PATTERN = re.compile(rb"/Count\s+(\d+)")
+DICT_SPAN = 2048  # Most bytes searched either side of "/Type /Pages" for its dictionary
+OVERLAP = 2 * DICT_SPAN  # Bytes kept between chunks so matches across a boundary are found
+
+
+class AttachmentRejected(Exception):
+    """The file cannot be attached, e.g. it is too large or not a PDF"""
+
+
+class IngestJob:
+    """Progress of reading one attachment on a worker thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = 0
+        self.read = 0
+        self.pages = None
+        self.media_type = "application/pdf"  # Set by the ingest function for other kinds
+        self.cancelled = False
+
+    @property
+    def progress(self):
+        return self.read / self.size if self.size else 0.0
+
+
+def count_pages(pages_found, largest_count):
+    """Best guess at the page count from what the scan found, None if unknown.
+
+    The page tree root's /Count is the real count when the scan found it.
+    Otherwise page objects are counted, though those inside compressed
+    object streams are not visible to a byte scan.
+    """
+    pages = largest_count or pages_found
+    return pages or None
+
+
+def page_tree_counts(window):
+    """/Count of every page tree node whose whole dictionary is in window"""
+    counts = []
+    for match in PAGES_PATTERN.finditer(window):
+        # The innermost dictionary around the match: no << or >> in between
+        start = window.rfind(b"<<", max(0, match.start() - DICT_SPAN), match.start())
+        end = window.find(b">>", match.end(), match.end() + DICT_SPAN)
+        if start < 0 or end < 0:
+            continue
+        if window.rfind(b">>", start, match.start()) >= 0 or window.find(b"<<", match.end(), end) >= 0:
+            continue  # Nested dictionaries, e.g. inline resources, not worth parsing
+        count = COUNT_PATTERN.search(window, start, end)
+        if count:
+            counts.append(int(count.group(1)))
+    return counts
+
+
+def ingest_pdf(job, on_progress=None, max_bytes=MAX_PDF_BYTES, max_pages=MAX_PDF_PAGES, chunk_size=CHUNK_SIZE):
+    """Read and base64-encode job.path in chunks, checking it against the limits.
+
+    Runs on a worker thread. on_progress(job) is called every PROGRESS_STEP
+    of the file. Returns the base64 data, or None if the job was cancelled;
+    raises AttachmentRejected if the file breaks a limit.
+    """
+    job.size = os.path.getsize(job.path)
+    if job.size > max_bytes:
+        raise AttachmentRejected(f"{job.name} is {job.size / (1024 * 1024):.1f} MB, "
+                                 f"the limit is {max_bytes / (1024 * 1024):.0f} MB")
+    if job.size == 0:
+        raise AttachmentRejected(f"{job.name} is empty")
+
+    encoded = []
+    pages_found = 0
+    largest_count = 0
+    tail = b""
+    reported = 0.0
+    with open(job.path, 'rb') as f:
+        header = f.read(5)
+        if header != b"%PDF-":
+            raise AttachmentRejected(f"{job.name} is not a PDF file")
+        f.seek(0)
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            if job.cancelled:
+                return None
+            encoded.append(base64.b64encode(chunk))
+
+            # Scan the chunk with the end of the previous one, counting only new matches;
+            # page tree nodes may be seen twice, which does not change the largest count
+            window = tail + chunk
+            for match in PAGE_PATTERN.finditer(window):
+                if match.end() > len(tail):
+                    pages_found += 1
+            largest_count = max([largest_count] + page_tree_counts(window))
+            tail = window[-OVERLAP:]
+
+            job.read += len(chunk)
+            if on_progress and job.progress - reported >= PROGRESS_STEP:
+                reported = job.progress
+                on_progress(job)
+
+    job.pages = count_pages(pages_found, largest_count)
+    if job.pages and job.pages > max_pages:
+        raise AttachmentRejected(f"{job.name} has {job.pages} pages, the limit is {max_pages}")
+    return b"".join(encoded).decode('ascii')
@@ -0,0 +1,148 @@
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILES = {name for name in os.listdir(APP_DIR) if name.endswith('.py')}
+
+
+class StallEvent:
+    """One period where the Tk thread did not get back to its event loop"""
+    __slots__ = ('started', 'duration', 'samples')
+
+    def __init__(self, started, duration, samples):
+        self.started = started  # Wall clock time
+        self.duration = duration  # Seconds
+        self.samples = samples  # Main thread stacks taken during the stall
+
+    def culprits(self, limit=3):
+        """Most sampled frames, preferring this app's own code"""
+        counts = Counter(_culprit_frame(stack) for stack in self.samples)
+        return counts.most_common(limit)
+
+    def to_dict(self):
+        return {
+            "started": self.started,
+            "duration_ms": round(self.duration * 1000, 1),
+            "samples": len(self.samples),
+            "culprits": [[frame, count] for frame, count in self.culprits()],
+            "stack": self.samples[len(self.samples) // 2] if self.samples else [],
+        }
+
+
+def _format_frame(frame):
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+
+
+def _culprit_frame(stack):
+    """Innermost frame from the app's own files, else the innermost frame"""
+    for frame in reversed(stack):
+        filename, location = frame.split(":", 1)
+        if filename == "main.py" and location.endswith(" main"):
+            break  # Only the mainloop call is ours, the time went to Tk itself
+        if filename in APP_FILES:
+            return frame
+    return f"{stack[-1]} (inside Tk)" if stack else "<no Python frames>"
+
+
+class StallWatchdog:
+    """Measures event loop jitter and samples the Tk thread's stack when it blocks.
+
+    A root.after tick runs every tick_ms on the Tk thread. A helper thread
+    checks how long ago the last tick ran; once that exceeds threshold_ms
+    it samples the main thread's stack every sample_ms until the loop gets
+    back. The next tick closes the stall and logs it with its duration and
+    the frames it was stuck in.
+    """
+
+    def __init__(self, root, threshold_ms=200, tick_ms=50, sample_ms=20, log_path=None, max_jitter_samples=20000):
+        self.root = root
+        self.threshold = threshold_ms / 1000
+        self.tick = tick_ms / 1000
+        self.sample_interval = sample_ms / 1000
+        self.log_path = log_path
+        self.main_thread_id = threading.main_thread().ident
+        self.jitter = deque(maxlen=max_jitter_samples)  # Seconds late per tick
+        self.events = []
+        self._lock = threading.Lock()
+        self._samples = []
+        self._last_tick = None
+        self._running = False
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._last_tick = time.perf_counter()
+        self.root.after(int(self.tick * 1000), self._on_tick)
+        threading.Thread(target=self._watch, name="stall-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._running = False
+
+    def _on_tick(self):
+        if not self._running:
+            return
+        now = time.perf_counter()
+        gap = now - self._last_tick
+        self._last_tick = now
+        self.jitter.append(max(0.0, gap - self.tick))
+        if gap > self.threshold:
+            with self._lock:
+                samples, self._samples = self._samples, []
+            self._record(StallEvent(time.time() - gap, gap, samples))
+        self.root.after(int(self.tick * 1000), self._on_tick)
+
+    def _watch(self):
+        while self._running:
+            time.sleep(self.sample_interval)
+            last = self._last_tick
+            if last is not None and time.perf_counter() - last > self.threshold:
+                frame = sys._current_frames().get(self.main_thread_id)
+                if frame is not None:
+                    stack = [_format_frame(f) for f in traceback.extract_stack(frame)]
+                    with self._lock:
+                        self._samples.append(stack)
+
+    def _record(self, event):
+        self.events.append(event)
+        culprits = ", ".join(f"{frame} x{count}" for frame, count in event.culprits()) or "no samples"
+        print(f"[stall] UI blocked {event.duration * 1000:.0f} ms: {culprits}", file=sys.stderr)
+        if self.log_path:
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(event.to_dict()) + "\n")
+            except OSError as e:
+                print(f"Could not write stall log: {e}", file=sys.stderr)
+
+    def report(self):
+        """Summary of jitter and stalls so far, worst code paths first"""
+        lines = ["Event loop stall report"]
+        jitter = sorted(self.jitter)
+        if jitter:
+            def pct(p):
+                return jitter[min(len(jitter) - 1, int(len(jitter) * p))] * 1000
+            lines.append(f"  ticks: {len(jitter)}  jitter p50={pct(0.5):.1f} ms  p95={pct(0.95):.1f} ms  "
+                         f"p99={pct(0.99):.1f} ms  max={jitter[-1] * 1000:.1f} ms")
+        total = sum(event.duration for event in self.events)
+        lines.append(f"  stalls over {self.threshold * 1000:.0f} ms: {len(self.events)}  "
+                     f"total {total:.2f} s  longest "
+                     f"{max((event.duration for event in self.events), default=0) * 1000:.0f} ms")
+
+        # Attribute each stall's time to its frames in proportion to their samples
+        blame = Counter()
+        for event in self.events:
+            if not event.samples:
+                blame["<not sampled>"] += event.duration
+                continue
+            for frame, count in Counter(_culprit_frame(stack) for stack in event.samples).items():
+                blame[frame] += event.duration * count / len(event.samples)
+        if blame:
+            lines.append("  blocked time by frame:")
+            for frame, seconds in blame.most_common(10):
+                lines.append(f"    {seconds * 1000:>8.0f} ms  {frame}")
+        return "\n".join(lines)
@@ -0,0 +1,41 @@
+from context_policy import context_flags, split_pinned
+
+ROLES = ["user", "assistant"] * 5
+
+
+def kept(flags):
+    return [i for i, flag in enumerate(flags) if flag]
+
+
+def test_newest_keeps_last_messages():
+    assert kept(context_flags(ROLES, [False] * 10, 3, "newest")) == [7, 8, 9]
+
+
+def test_pinned_messages_do_not_count_towards_size():
+    pinned = [True] + [False] * 9
+    assert kept(context_flags(ROLES, pinned, 2, "newest")) == [0, 8, 9]
+    assert kept(context_flags(ROLES, pinned, 2, "replies-first")) == [0, 8, 9]
+
+
+def test_replies_first_evicts_old_replies_before_user_messages():
+    assert kept(context_flags(ROLES, [False] * 10, 6, "replies-first")) == [0, 2, 4, 6, 8, 9]
+
+
+def test_replies_first_never_exceeds_context_size():
+    for size in range(11):
+        for policy in ("newest", "replies-first"):
+            flags = context_flags(ROLES, [False] * 10, size, policy)
+            assert len(kept(flags)) == size, (size, policy)
+    # Smaller than the protected tail: still only the newest message
+    assert kept(context_flags(ROLES, [False] * 10, 1, "replies-first")) == [9]
+
+
+def test_zero_size_keeps_only_pinned():
+    pinned = [False] * 4 + [True] + [False] * 5
+    assert kept(context_flags(ROLES, pinned, 0, "replies-first")) == [4]
+
+
+def test_split_pinned_moves_early_pins_out_of_the_window():
+    pinned = [True] + [False] * 9
+    flags = context_flags(ROLES, pinned, 3, "newest")
+    assert split_pinned(flags, pinned) == ([0], [7, 8, 9])
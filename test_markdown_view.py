@@ -0,0 +1,50 @@
+from markdown_view import parse_blocks, reparse
+
+SAMPLE = """# Title
+
+Some *italic*, **bold** and `code` in a paragraph
+that continues on a second line.
+
+## List
+
+- first item
+- second item with __bold__
+  - nested item
+1. numbered
+2) another
+
+> a quote
+> more quote
+
+```python
+def f():
+
+    return 1
+```
+
+---
+Closing paragraph with _emphasis_.
+~~~
+unclosed fence
+"""
+
+
+def as_tuples(blocks):
+    return [(block.start, block.kind, block.level, block.runs) for block in blocks]
+
+
+def test_reparse_matches_full_parse_for_every_prefix():
+    # Streaming: each prefix extends the previous one by a character
+    blocks = []
+    for end in range(len(SAMPLE) + 1):
+        text = SAMPLE[:end]
+        blocks = reparse(blocks, text)
+        assert as_tuples(blocks) == as_tuples(parse_blocks(text)), repr(text)
+
+
+def test_reparse_in_larger_steps():
+    for step in (7, 64):
+        blocks = []
+        for end in list(range(0, len(SAMPLE), step)) + [len(SAMPLE)]:
+            blocks = reparse(blocks, SAMPLE[:end])
+        assert as_tuples(blocks) == as_tuples(parse_blocks(SAMPLE))
@@ -0,0 +1,202 @@
+"""Token usage and cost per request, stored with each conversation.
+
+Every reply (and every summary update) adds one entry holding the token
+counts from response.usage, the estimated cost and what the request
+carried: how many history messages, whether a summary was included, and
+which attachments. Saved chats and autosaves contain their ledger, so it
+can be queried without the app:
+
+    python usage_ledger.py chat1.json chat2.json --by day
+    python usage_ledger.py autosave/session-*.json --turns
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from collections import OrderedDict
+
+# USD per million tokens: input, output, cache write, cache read
+PRICES = {
+    "claude-3-5-sonnet-20241022": (3.00, 15.00, 3.75, 0.30),
+    "claude-3-5-haiku-20241022": (0.80, 4.00, 1.00, 0.08),
+    "claude-3-opus-20240229": (15.00, 75.00, 18.75, 1.50),
+}
+TOKEN_FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+
+def estimate_cost(model, usage):
+    """Cost in USD of one response's usage, None for models without a price"""
+    prices = PRICES.get(model)
+    if prices is None or not usage:
+        return None
+    return sum(usage.get(field, 0) * price for field, price in zip(TOKEN_FIELDS, prices)) / 1_000_000
+
+
+def describe_request(api_params, attachment_paths):
+    """What a request carried: history, summary and attachments.
+
+    attachment_paths are the paths of the documents and images in the last
+    message, in order. Measured on the Tk thread when the request is built.
+    """
+    messages = api_params.get("messages", [])
+    history_chars = 0
+    for message in messages[:-1]:
+        content = message["content"]
+        if isinstance(content, str):
+            history_chars += len(content)
+        else:
+            history_chars += sum(len(block.get("text", "")) for block in content)
+
+    attachments = []
+    last = messages[-1]["content"] if messages else ""
+    blocks = [block for block in last if block.get("type") in ("document", "image")] if isinstance(last, list) else []
+    for path, block in zip(attachment_paths, blocks):
+        attachments.append({"name": os.path.basename(path), "bytes": len(block["source"]["data"])})
+
+    system = api_params.get("system") or []
+    return {
+        "history_messages": len(messages) - 1 if messages else 0,
+        "history_chars": history_chars,
+        "summary": any(block.get("text", "").startswith("Summary of the earlier") for block in system),
+        "attachments": attachments,
+    }
+
+
+def make_entry(kind, model, usage, request=None, latency=None):
+    """One ledger row; kind is "reply", "fanout", "map" or "summary" """
+    entry = {
+        "time": time.time(),
+        "kind": kind,
+        "model": model,
+        "usage": usage or {},
+        "cost": estimate_cost(model, usage),
+    }
+    if request:
+        entry["request"] = request
+    if latency:
+        entry["latency"] = latency
+    return entry
+
+
+def totals(entries):
+    """Summed token counts, cost and number of requests"""
+    result = dict.fromkeys(TOKEN_FIELDS, 0)
+    result["requests"] = 0
+    result["cost"] = 0.0
+    result["unpriced"] = 0  # Requests to models without a known price
+    for entry in entries:
+        result["requests"] += 1
+        for field in TOKEN_FIELDS:
+            result[field] += entry.get("usage", {}).get(field, 0) or 0
+        if entry.get("cost") is None:
+            result["unpriced"] += 1
+        else:
+            result["cost"] += entry["cost"]
+    return result
+
+
+def group_by(entries, key):
+    """{group: totals} with key(entry) naming each entry's group, in first-seen order"""
+    groups = OrderedDict()
+    for entry in entries:
+        groups.setdefault(key(entry), []).append(entry)
+    return OrderedDict((name, totals(group)) for name, group in groups.items())
+
+
+def day_of(entry):
+    return time.strftime("%Y-%m-%d", time.localtime(entry["time"]))
+
+
+def format_totals(t):
+    text = (f"{t['requests']:>5} requests  in {t['input_tokens']:>9}  out {t['output_tokens']:>8}  "
+            f"cache write {t['cache_creation_input_tokens']:>8}  read {t['cache_read_input_tokens']:>9}  "
+            f"${t['cost']:.4f}")
+    if t["unpriced"]:
+        text += f" (+{t['unpriced']} unpriced)"
+    return text
+
+
+def short_summary(entries):
+    """One line for the chat window"""
+    t = totals(entries)
+    if not t["requests"]:
+        return ""
+    tokens = t["input_tokens"] + t["cache_creation_input_tokens"] + t["cache_read_input_tokens"]
+    return f"Usage: {tokens / 1000:.1f}k in, {t['output_tokens'] / 1000:.1f}k out, ${t['cost']:.4f}"
+
+
+def format_turn(entry):
+    usage = entry.get("usage", {})
+    request = entry.get("request", {})
+    parts = [
+        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["time"])),
+        f"{entry['kind']:<7}",
+        entry["model"],
+        f"in {usage.get('input_tokens', 0)}",
+        f"out {usage.get('output_tokens', 0)}",
+        f"cache w/r {usage.get('cache_creation_input_tokens', 0)}/{usage.get('cache_read_input_tokens', 0)}",
+        "$?" if entry.get("cost") is None else f"${entry['cost']:.4f}",
+    ]
+    if request:
+        parts.append(f"history {request['history_messages']} msgs/{request['history_chars']} chars")
+        if request.get("summary"):
+            parts.append("+summary")
+        for attachment in request.get("attachments", []):
+            parts.append(f"[{attachment['name']} {attachment['bytes'] // 1024} KB]")
+    return "  ".join(parts)
+
+
+def load_ledgers(paths):
+    """[(chat name, entries)] from saved conversation or autosave files"""
+    ledgers = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        ledgers.append((os.path.basename(path), data.get("ledger", [])))
+    return ledgers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report token usage and cost from saved chats")
+    parser.add_argument("files", nargs="+", help="saved chat or autosave JSON files (globs allowed)")
+    parser.add_argument("--by", choices=["chat", "day", "model", "kind"], default="chat")
+    parser.add_argument("--turns", action="store_true", help="list every request with what it carried")
+    args = parser.parse_args()
+
+    paths = []
+    for pattern in args.files:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    ledgers = load_ledgers(paths)
+    entries = []
+    for chat, ledger in ledgers:
+        for entry in ledger:
+            entries.append(dict(entry, chat=chat))
+    entries.sort(key=lambda entry: entry["time"])
+
+    if args.turns:
+        for chat, ledger in ledgers:
+            print(chat)
+            for entry in ledger:
+                print("  " + format_turn(entry))
+        print()
+
+    keys = {
+        "chat": lambda entry: entry["chat"],
+        "day": day_of,
+        "model": lambda entry: entry["model"],
+        "kind": lambda entry: entry["kind"],
+    }
+    groups = group_by(entries, keys[args.by])
+    width = max((len(str(name)) for name in groups), default=5)
+    for name, group_totals in groups.items():
+        print(f"{name:<{width}}  {format_totals(group_totals)}")
+    print(f"{'total':<{width}}  {format_totals(totals(entries))}")
+
+
+if __name__ == "__main__":
+    main()